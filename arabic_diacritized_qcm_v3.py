@@ -6,12 +6,19 @@ import re
 import json
 import argparse
 import sys
-from typing import List, Dict, Any
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Callable, Tuple
 import numpy as np
-from openai import OpenAI
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
-import faiss
+from pdf_extraction import iter_numbered_pages
+from chunker import CHUNK_SIZE, iter_page_chunks
+from embedding_backends import create_embedding_backend
+from embedding_cache import get_default_cache, get_query_cache
+from index_registry import DocumentIndex
+from vector_index import create_flat_index
+from llm_gateway import get_gateway, INTERACTIVE, BULK
+from result_cache import get_result_cache, make_key
 
 # Set console encoding to UTF-8 for Windows
 if sys.platform == 'win32':
@@ -22,160 +29,219 @@ if sys.platform == 'win32':
 # Load environment variables
 load_dotenv()
 
+# Embedding settings (the model is chosen by EMBEDDING_BACKEND, see embedding_backends)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+
+# Bump when the generation prompt changes so cached results are not reused
+GENERATION_PROMPT_VERSION = "1"
+
 class ArabicDiacritizedQCMGenerator:
     def __init__(self, training_pdf_path: str = None):
         """
         Initialize the Arabic QCM generator with diacritics.
         """
-        # Initialize OpenAI client
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OpenAI API key not found in environment variables")
-            
-        self.client = OpenAI(api_key=api_key)
+        # All OpenAI calls go through the shared, rate-limited gateway
+        self.gateway = get_gateway()
         self.model = "gpt-4o-mini"  # Default model
         
+        # Remote (OpenAI) or local (SentenceTransformer) embeddings
+        self.embedder = create_embedding_backend(gateway=self.gateway)
+        
         # Initialize vector database
         self.index = None
         self.chunks = []
         self.embeddings = None
         
+        # Persistent embedding cache shared across uploads
+        self.embedding_cache = get_default_cache()
+        # Embeddings of recent retrieval queries
+        self.query_cache = get_query_cache()
+        
         # Load training data if provided
         if training_pdf_path and os.path.exists(training_pdf_path):
             self.load_training_data(training_pdf_path)
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extract text from a PDF file."""
-        text = ""
-        try:
-            reader = PdfReader(pdf_path)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        except Exception as e:
-            print(f"Error extracting text from PDF: {e}")
-        return text
+        return "".join(page_text + "\n" for page_text in self.iter_pdf_pages(pdf_path))
     
-    def clean_text(self, text: str) -> str:
-        """Clean the input text by removing extra whitespaces."""
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
+    def iter_pdf_pages(self, pdf_path: str) -> Iterator[str]:
+        """Yield the text of each page of a PDF as it is extracted."""
+        for _, page_text in self.iter_numbered_pages(pdf_path):
+            yield page_text
     
-    def create_chunks(self, text: str, chunk_size: int = 500) -> List[str]:
-        """Create chunks from the input text with larger chunk size for Arabic."""
-        # Clean the text first
-        text = self.clean_text(text)
-        
-        # Split into paragraphs
-        paragraphs = text.split('\n')
-        paragraphs = [p.strip() for p in paragraphs if p.strip()]
-        
-        chunks = []
-        current_chunk = ""
-        
-        for paragraph in paragraphs:
-            # If paragraph itself is too long, split it into sentences
-            if len(paragraph) > chunk_size:
-                # Use Arabic-specific sentence splitting
-                sentences = re.split(r'[.!?؟،]', paragraph)
-                for sentence in sentences:
-                    sentence = sentence.strip()
-                    if not sentence:
-                        continue
-                        
-                    # If adding this sentence would exceed chunk size, save current chunk and start a new one
-                    if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
-                        chunks.append(current_chunk.strip())
-                        current_chunk = sentence
-                    else:
-                        current_chunk += " " + sentence if current_chunk else sentence
-            else:
-                # Try to keep semantic units together
-                # If adding this paragraph would exceed chunk size, save current chunk and start a new one
-                if len(current_chunk) + len(paragraph) > chunk_size and current_chunk:
-                    chunks.append(current_chunk.strip())
-                    current_chunk = paragraph
-                else:
-                    current_chunk += " " + paragraph if current_chunk else paragraph
-        
-        # Add the last chunk if it's not empty
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
-        
-        # Ensure chunks have some overlap for context continuity
-        if len(chunks) > 1:
-            for i in range(1, len(chunks)):
-                # Add a bit of the previous chunk to the current one for context
-                words = chunks[i-1].split()
-                if len(words) > 10:  # If previous chunk has enough words
-                    overlap = " ".join(words[-10:])
-                    chunks[i] = overlap + " " + chunks[i]
-        
-        return chunks
+    def iter_numbered_pages(self, pdf_path: str, workers: int = None) -> Iterator[Tuple[int, str]]:
+        """Yield (page number, text) for each non-empty page of a PDF, in order (see pdf_extraction)."""
+        return iter_numbered_pages(pdf_path, workers)
+    
+    def iter_numbered_chunks(self, pages: Iterable[Tuple[int, str]],
+                             chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, int]]:
+        """
+        Chunk a stream of numbered pages incrementally.
+        
+        Produces the same chunks as chunker.chunk_text on the joined text, but
+        only keeps the unfinished chunk in memory, so chunks are yielded
+        while later pages are still being read. Each chunk comes with the
+        number of the page where it starts.
+        """
+        return iter_page_chunks(pages, chunk_size)
     
     def embed_text(self, text: str) -> np.ndarray:
-        """Embed a text using the OpenAI embeddings."""
+        """Embed a text with the embedding backend."""
         try:
-            response = self.client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=text
-            )
-            return np.array(response.data[0].embedding)
+            return self.embedder.embed_batch([text], priority=INTERACTIVE)[0]
         except Exception as e:
             print(f"Error embedding text: {e}")
             # Return a zero vector as fallback
-            return np.zeros(1536)  # Ada-002 embedding size
+            return np.zeros(self.embedder.dimension)
     
-    def load_training_data(self, pdf_path: str) -> None:
-        """Load and index training data from a PDF."""
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a retrieval query, going through the query embedding cache."""
+        vector = self.query_cache.get(self.embedder.name, query)
+        if vector is not None:
+            return vector
+        vector = self.embed_text(query)
+        # Never cache the zero vector returned when embedding fails
+        if np.any(vector):
+            self.query_cache.put(self.embedder.name, query, vector)
+        return vector
+    
+    def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        """
+        Embed one batch of texts with the embedding backend.
+        
+        Transient OpenAI failures are retried by the gateway; a batch that
+        still fails raises instead of producing zero vectors.
+        """
+        return self.embedder.embed_batch(batch, priority=BULK)
+    
+    def _embed_with_cache(self, batch: List[str]) -> np.ndarray:
+        """Embed one batch, only sending the texts missing from the cache."""
+        embeddings = np.zeros((len(batch), self.embedder.dimension), dtype='float32')
+        cached = self.embedding_cache.get_many(self.embedder.name, batch)
+        for i, vector in cached.items():
+            embeddings[i] = vector
+        missing = [i for i in range(len(batch)) if i not in cached]
+        if missing:
+            vectors = self._embed_batch([batch[i] for i in missing])
+            embeddings[missing] = vectors
+            self.embedding_cache.put_many(self.embedder.name, [batch[i] for i in missing], vectors)
+        return embeddings
+    
+    def build_document_index(self, pdf_path: str, on_start: Callable[[DocumentIndex], None] = None,
+                             on_progress: Callable[[int, int], None] = None,
+                             batch_size: int = EMBEDDING_BATCH_SIZE,
+                             max_concurrency: int = EMBEDDING_MAX_CONCURRENCY) -> DocumentIndex:
+        """
+        Extract, chunk, embed and index a PDF without touching the generator state.
+        
+        Pages are parsed, chunked and embedded as a pipeline: each batch of
+        chunks is sent to the embedder while later pages are still being
+        read, and added to the index as soon as its embeddings are back. At
+        most a few batches are in flight, so memory does not grow with the
+        size of the PDF beyond the index itself.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            on_start: Called with the (still empty) document as soon as it
+                exists, so it can be searched while ingestion continues
+            on_progress: Called with (pages parsed, chunks embedded) as
+                ingestion advances
+        """
         print(f"Loading training data from {pdf_path}...")
         
-        # Extract text from PDF
-        text = self.extract_text_from_pdf(pdf_path)
-        
-        # Create chunks
-        self.chunks = self.create_chunks(text)
-        print(f"Created {len(self.chunks)} chunks from training data")
-        
-        # Embed chunks
-        print("Embedding chunks...")
-        self.embeddings = np.zeros((len(self.chunks), 1536))
-        for i, chunk in enumerate(self.chunks):
-            self.embeddings[i] = self.embed_text(chunk)
-            if (i + 1) % 10 == 0:
-                print(f"Embedded {i + 1}/{len(self.chunks)} chunks")
-        
-        # Create FAISS index
-        self.index = faiss.IndexFlatL2(1536)
-        self.index.add(self.embeddings.astype('float32'))
-        print("Training data indexed successfully")
+        # Filled as a flat index so chunks are searchable while ingestion runs
+        document = DocumentIndex(os.path.basename(pdf_path), create_flat_index(self.embedder.dimension), [], complete=False,
+                                 pages=[])
+        if on_start:
+            on_start(document)
+        
+        max_concurrency = min(max_concurrency, self.embedder.max_concurrency or max_concurrency)
+        max_pending = 2 * max(1, max_concurrency)
+        pending = deque()
+        pages_parsed = 0
+        
+        def report():
+            if on_progress:
+                on_progress(pages_parsed, len(document.chunks))
+        
+        def counted_pages():
+            nonlocal pages_parsed
+            for page in self.iter_numbered_pages(pdf_path):
+                pages_parsed += 1
+                report()
+                yield page
+        
+        def drain(limit):
+            # Add finished batches in order so index positions match chunks
+            while len(pending) > limit:
+                batch, batch_pages, future = pending.popleft()
+                document.add(future.result(), batch, batch_pages)
+                print(f"Embedded {len(document.chunks)} chunks")
+                report()
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            batch, batch_pages = [], []
+            for chunk, page_number in self.iter_numbered_chunks(counted_pages()):
+                batch.append(chunk)
+                batch_pages.append(page_number)
+                if len(batch) == batch_size:
+                    pending.append((batch, batch_pages, executor.submit(self._embed_with_cache, batch)))
+                    batch, batch_pages = [], []
+                    drain(max_pending)
+            if batch:
+                pending.append((batch, batch_pages, executor.submit(self._embed_with_cache, batch)))
+            drain(0)
+        
+        # Large documents are rebuilt as an approximate index (see vector_index)
+        document.optimize()
+        document.complete = True
+        print(f"Training data indexed successfully ({len(document.chunks)} chunks)")
+        return document
     
-    def retrieve_relevant_chunks(self, query: str, top_k: int = 8) -> List[str]:
+    def load_training_data(self, pdf_path: str) -> None:
+        """Load and index training data from a PDF."""
+        document = self.build_document_index(pdf_path)
+        self.index = document.index
+        self.chunks = document.chunks
+    
+    def retrieve_relevant_chunks(self, query: str, top_k: int = 8, document: DocumentIndex = None) -> List[str]:
         """Retrieve relevant chunks for a query with improved selection."""
-        if self.index is None or len(self.chunks) == 0:
+        if document is None and self.index is not None:
+            document = DocumentIndex("default", self.index, self.chunks)
+        
+        if document is None or len(document.chunks) == 0:
             print("No training data loaded. Using only the query.")
             return [query]
         
+        if document.index.d != self.embedder.dimension:
+            print(f"Index of {document.name} was built with another embedding model. Using only the query.")
+            return [query]
+        
         # Enhance query for better retrieval
         enhanced_query = f"معلومات عن: {query}"
         
-        # Embed the query
-        query_embedding = self.embed_text(enhanced_query)
+        # Embed the query, reusing the vector of a recent identical query
+        query_embedding = self.embed_query(enhanced_query)
         
         # Search the index
-        k = min(top_k, len(self.chunks))
-        distances, indices = self.index.search(query_embedding.reshape(1, -1).astype('float32'), k)
+        distances, indices = document.search(query_embedding.reshape(1, -1).astype('float32'), top_k)
+        
+        # Approximate indexes may return fewer results, padded with -1
+        found = indices[0] >= 0
+        distances, indices = distances[:, found], indices[:, found]
         
         # Get the relevant chunks
-        relevant_chunks = [self.chunks[idx] for idx in indices[0]]
+        relevant_chunks = [document.chunks[idx] for idx in indices[0]]
         
         # Print detailed debugging information
         print(f"\n=== RAG Retrieval Debug ===")
         print(f"Query: {query}")
         print(f"Retrieved {len(relevant_chunks)} chunks")
         for i, (chunk, idx, dist) in enumerate(zip(relevant_chunks, indices[0], distances[0])):
-            print(f"\nChunk {i+1} (index {idx}, distance {dist:.4f}):")
+            page = f", page {document.pages[idx]}" if document.pages else ""
+            print(f"\nChunk {i+1} (index {idx}{page}, distance {dist:.4f}):")
             print(f"{chunk[:150]}...")
         print("===========================\n")
         
@@ -188,8 +254,15 @@ class ArabicDiacritizedQCMGenerator:
         
         return relevant_chunks
     
-    def generate_diacritized_qcm(self, text: str, num_questions: int = 3, direct_text: bool = False) -> List[Dict[str, Any]]:
-        """Generate diacritized QCMs from a text."""
+    def generate_diacritized_qcm(self, text: str, num_questions: int = 3, direct_text: bool = False,
+                                 document: DocumentIndex = None, force_fresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Generate diacritized QCMs from a text.
+        
+        When the result cache is enabled, results are reused for the same
+        context, number of questions, model and prompt version unless
+        force_fresh is set.
+        """
         # Check if this is a direct text query with specific instructions
         if text.startswith("أنشئ أسئلة اختيار من متعدد فقط عن النص التالي:"):
             direct_text = True
@@ -205,11 +278,21 @@ class ArabicDiacritizedQCMGenerator:
             context = content_text
         else:
             # Retrieve relevant chunks
-            relevant_chunks = self.retrieve_relevant_chunks(text, top_k=8)
+            relevant_chunks = self.retrieve_relevant_chunks(text, top_k=8, document=document)
             
             # Combine relevant chunks for context
             context = "\n\n".join(relevant_chunks)
         
+        # Reuse a cached result for the same context and parameters
+        result_cache = get_result_cache()
+        cache_key = make_key("generation", context, num_questions=num_questions, model=self.model,
+                             prompt_version=GENERATION_PROMPT_VERSION)
+        if result_cache is not None and not force_fresh:
+            cached_qcms = result_cache.get(cache_key)
+            if cached_qcms is not None:
+                print("Using cached QCMs for this context")
+                return cached_qcms
+        
         # Create prompt
         prompt = f"""
 أنشئ {num_questions} أسئلة اختيار من متعدد باللغة العربية استنادًا فقط إلى النص التالي:
@@ -242,7 +325,8 @@ class ArabicDiacritizedQCMGenerator:
 
         try:
             print(f"Sending request to OpenAI using model: {self.model}")
-            response = self.client.chat.completions.create(
+            response = self.gateway.chat_completion(
+                priority=INTERACTIVE,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "أنت مساعد متخصص في إنشاء أسئلة اختيار من متعدد باللغة العربية مع التشكيل الكامل من النصوص التعليمية. استخدم فقط المعلومات الموجودة في النص المقدم. ضع علامات التشكيل الكاملة على كل حرف. أعطِ الإجابة بتنسيق JSON فقط."},
@@ -282,6 +366,8 @@ class ArabicDiacritizedQCMGenerator:
                         if qcm["correct_answer"] not in qcm["choices"]:
                             qcm["choices"].append(qcm["correct_answer"])
                 
+                if result_cache is not None:
+                    result_cache.put(cache_key, qcms)
                 return qcms
             except json.JSONDecodeError as e:
                 print(f"Failed to parse JSON: {e}. Trying to extract QCMs manually.")
@@ -0,0 +1,104 @@
+"""
+Asynchronous MongoDB data layer for the FastAPI endpoints.
+"""
+import os
+import time
+import asyncio
+import functools
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import db
+
+# Threads running database calls; more than the pool size would only wait for connections
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(db.MONGODB_MAX_POOL_SIZE)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get the executor dedicated to database calls, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, DB_EXECUTOR_WORKERS), thread_name_prefix="mongo")
+        return _executor
+
+
+async def run(fn, *args, **kwargs):
+    """
+    Run a synchronous db function on the database executor.
+
+    At most DB_EXECUTOR_WORKERS calls run at once. The event loop keeps
+    serving other requests while they wait for MongoDB.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+async def insert_text(text_content: str, level: int, difficulty: str, qcms: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Save a text with its QCMs (see db.insert_text)."""
+    return await run(db.insert_text, text_content, level, difficulty, qcms)
+
+
+async def insert_texts(text_sets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Save many texts with their QCMs (see db.insert_texts)."""
+    return await run(db.insert_texts, text_sets)
+
+
+async def save_text_with_qcms(text_content: str, level: int, difficulty: str, qcms: List[Dict[str, Any]]) -> str:
+    """Save a text with its QCMs and return its ID (see db.save_text_with_qcms)."""
+    return await run(db.save_text_with_qcms, text_content, level, difficulty, qcms)
+
+
+async def get_text_by_id(text_id: str) -> Dict[str, Any]:
+    """Get a text by its ID (see db.get_text_by_id)."""
+    return await run(db.get_text_by_id, text_id)
+
+
+async def list_texts(after: Optional[int] = None, limit: int = 50, level: Optional[int] = None,
+                     difficulty: Optional[str] = None,
+                     summary: bool = True) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Get one page of texts (see db.list_texts)."""
+    return await run(db.list_texts, after, limit, level, difficulty, summary)
+
+
+async def iter_texts(level: Optional[int] = None, difficulty: Optional[str] = None, summary: bool = False,
+                     batch_size: int = 100) -> AsyncIterator[Dict[str, Any]]:
+    """Iterate over all matching texts, fetching batch_size of them per executor call (see db.iter_texts)."""
+    # The generator does not touch the database until it is first advanced
+    texts = db.iter_texts(level, difficulty, summary, batch_size)
+    while True:
+        batch = await run(lambda: list(islice(texts, batch_size)))
+        for text in batch:
+            yield text
+        if len(batch) < batch_size:
+            return
+
+
+async def health() -> Dict[str, Any]:
+    """
+    Check whether MongoDB answers, and report the pool settings.
+
+    Returns:
+        Dict with status ("ok" or "unavailable"), ping latency and pool settings
+    """
+    started = time.perf_counter()
+    reachable = await run(db.ping)
+    return {
+        "status": "ok" if reachable else "unavailable",
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        "executor_workers": DB_EXECUTOR_WORKERS,
+        **db.pool_options()
+    }
+
+
+def shutdown() -> None:
+    """Stop the database executor once its pending calls are done."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -0,0 +1,82 @@
+"""
+Benchmark the offset-based chunker against the previous create_chunks.
+
+The text of each PDF is repeated to simulate a large document, since the
+previous implementation grows faster than linearly with the text length.
+
+Usage:
+    python benchmarks/bench_chunker.py [--repeat N] [pdf ...]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunker import chunk_text
+from pdf_extraction import iter_numbered_pages
+
+
+def legacy_create_chunks(text, chunk_size=500):
+    """The create_chunks implementation replaced by chunker.chunk_text."""
+    text = re.sub(r'\s+', ' ', text).strip()
+    paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
+
+    chunks = []
+    current_chunk = ""
+    for paragraph in paragraphs:
+        if len(paragraph) > chunk_size:
+            for sentence in re.split(r'[.!?؟،]', paragraph):
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
+                    chunks.append(current_chunk.strip())
+                    current_chunk = sentence
+                else:
+                    current_chunk += " " + sentence if current_chunk else sentence
+        else:
+            if len(current_chunk) + len(paragraph) > chunk_size and current_chunk:
+                chunks.append(current_chunk.strip())
+                current_chunk = paragraph
+            else:
+                current_chunk += " " + paragraph if current_chunk else paragraph
+
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+
+    if len(chunks) > 1:
+        for i in range(1, len(chunks)):
+            words = chunks[i-1].split()
+            if len(words) > 10:
+                chunks[i] = " ".join(words[-10:]) + " " + chunks[i]
+
+    return chunks
+
+
+def time_chunking(fn, text):
+    start = time.perf_counter()
+    chunks = fn(text)
+    return time.perf_counter() - start, chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark text chunking')
+    parser.add_argument('pdfs', nargs='*', default=['arabic.pdf'], help='PDF files (defaults to arabic.pdf)')
+    parser.add_argument('--repeat', '-r', type=int, default=50, help='Number of times the PDF text is repeated')
+    args = parser.parse_args()
+
+    print(f"{'PDF':40} {'chars':>9} {'legacy (s)':>11} {'chunker (s)':>12} {'speedup':>8} {'chunks':>13}")
+    for pdf_path in args.pdfs:
+        text = "".join(page_text + "\n" for _, page_text in iter_numbered_pages(pdf_path, workers=1)) * args.repeat
+        legacy_time, legacy_chunks = time_chunking(legacy_create_chunks, text)
+        new_time, new_chunks = time_chunking(chunk_text, text)
+        speedup = legacy_time / new_time if new_time else float('inf')
+        print(f"{os.path.basename(pdf_path)[:40]:40} {len(text):>9} {legacy_time:>11.3f} {new_time:>12.3f} "
+              f"{speedup:>7.2f}x {len(legacy_chunks):>6}/{len(new_chunks):<6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark recall and query latency of the FAISS index types against flat search.
+
+Vectors are synthetic: points scattered around random centers, which is
+closer to real embeddings than uniform noise. Index sizes of a million
+1536-dimensional vectors need about 6 GB of memory per index.
+
+Usage:
+    python benchmarks/bench_faiss_index.py [--sizes 10000 100000 1000000] [--dim 1536]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import build_index, search_index
+
+
+def make_vectors(num_vectors, dimension, rng, num_centers=256):
+    centers = rng.standard_normal((num_centers, dimension)).astype('float32')
+    labels = rng.integers(0, num_centers, num_vectors)
+    return centers[labels] + 0.5 * rng.standard_normal((num_vectors, dimension)).astype('float32')
+
+
+def time_search(index, queries, top_k):
+    start = time.perf_counter()
+    _, indices = search_index(index, queries, top_k)
+    return (time.perf_counter() - start) * 1000 / len(queries), indices
+
+
+def recall(found, expected):
+    hits = sum(len(set(row_found) & set(row_expected)) for row_found, row_expected in zip(found, expected))
+    return hits / expected.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark FAISS index types')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='Corpus sizes')
+    parser.add_argument('--dim', type=int, default=1536, help='Vector dimension')
+    parser.add_argument('--queries', type=int, default=200, help='Number of queries')
+    parser.add_argument('--top-k', '-k', type=int, default=8, help='Neighbours per query')
+    parser.add_argument('--metric', choices=['l2', 'cosine'], default='l2', help='Distance metric')
+    parser.add_argument('--nprobe', type=int, default=None, help='IVF lists visited per query')
+    parser.add_argument('--ef-search', type=int, default=None, help='HNSW candidate list size')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>9} {'index':>6} {'build (s)':>10} {'query (ms)':>11} {'recall@' + str(args.top_k):>9}")
+    for size in args.sizes:
+        vectors = make_vectors(size, args.dim, rng)
+        queries = make_vectors(args.queries, args.dim, rng)
+
+        flat = build_index(vectors, "flat", args.metric)
+        flat_latency, expected = time_search(flat, queries, args.top_k)
+        print(f"{size:>9} {'flat':>6} {'-':>10} {flat_latency:>11.3f} {1.0:>9.3f}")
+        del flat
+
+        for index_type in ("hnsw", "ivf"):
+            start = time.perf_counter()
+            index = build_index(vectors, index_type, args.metric, args.nprobe, args.ef_search)
+            build_time = time.perf_counter() - start
+            latency, found = time_search(index, queries, args.top_k)
+            print(f"{size:>9} {index_type:>6} {build_time:>10.2f} {latency:>11.3f} {recall(found, expected):>9.3f}")
+            del index
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Benchmark serial vs multi-process PDF text extraction on the uploaded PDFs.
+
+Usage:
+    python benchmarks/bench_pdf_extraction.py [--workers N] [pdf ...]
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_extraction import iter_numbered_pages
+
+
+def time_extraction(pdf_path, workers):
+    start = time.perf_counter()
+    pages = list(iter_numbered_pages(pdf_path, workers=workers))
+    return time.perf_counter() - start, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PDF text extraction')
+    parser.add_argument('pdfs', nargs='*', help='PDF files (defaults to uploads/*.pdf)')
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count() or 1, help='Number of extraction processes')
+    args = parser.parse_args()
+
+    pdfs = args.pdfs or sorted(glob.glob("uploads/*.pdf"))
+
+    print(f"{'PDF':40} {'pages':>6} {'serial (s)':>11} {'parallel (s)':>13} {'speedup':>8}")
+    for pdf_path in pdfs:
+        serial_time, serial_pages = time_extraction(pdf_path, workers=1)
+        parallel_time, parallel_pages = time_extraction(pdf_path, workers=args.workers)
+        if serial_pages != parallel_pages:
+            print(f"Warning: parallel extraction of {pdf_path} differs from serial extraction")
+        speedup = serial_time / parallel_time if parallel_time else float('inf')
+        print(f"{os.path.basename(pdf_path)[:40]:40} {len(serial_pages):>6} {serial_time:>11.2f} {parallel_time:>13.2f} {speedup:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
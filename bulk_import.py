@@ -0,0 +1,227 @@
+"""
+Bulk import of saved QCM sets (e.g. Saved_qcms/) into MongoDB.
+
+Usage:
+    python bulk_import.py Saved_qcms --workers 4 --batch-size 500
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Tuple
+import db
+from models import Text
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "4"))
+# Files already imported, one path per line, so an interrupted import can resume
+IMPORT_STATE_PATH = os.getenv("IMPORT_STATE_PATH", ".bulk_import_state")
+# Seconds between two progress reports
+IMPORT_REPORT_INTERVAL = float(os.getenv("IMPORT_REPORT_INTERVAL", "5"))
+
+
+def iter_json_files(directory: str) -> Iterator[str]:
+    """Iterate over the JSON files below a directory, in a stable order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".json"):
+                yield os.path.join(root, name)
+
+
+def load_text_file(path: str) -> Text:
+    """
+    Load and validate a saved QCM set.
+
+    Raises:
+        ValueError: If the file is not valid JSON or has no valid text
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return db.text_from_json(data)
+
+
+class ImportState:
+    def __init__(self, path: str = IMPORT_STATE_PATH):
+        """
+        Initialize the import state.
+
+        Keeps the paths of the files whose texts are stored (or were
+        duplicates) in an append-only file, written only once their batch
+        is inserted. Texts are also deduplicated by content hash, so files
+        inserted just before an interruption are not imported twice.
+
+        Args:
+            path: Path of the state file (None to keep no state)
+        """
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+
+    def mark(self, paths: List[str]) -> None:
+        """Record files as imported."""
+        if not paths:
+            return
+        with self._lock:
+            self.done.update(paths)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(f"{path}\n" for path in paths))
+
+    def reset(self) -> None:
+        """Forget every imported file."""
+        with self._lock:
+            self.done = set()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class BulkImporter:
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE, workers: int = IMPORT_WORKERS,
+                 state: ImportState = None, report_interval: float = IMPORT_REPORT_INTERVAL):
+        """
+        Initialize the bulk importer.
+
+        Files are read and validated in the calling thread, and batches of
+        new texts are checked against the stored hashes and inserted by a
+        pool of workers, each with its own block of text IDs.
+
+        Args:
+            batch_size: Number of texts per insert_many
+            workers: Number of batches inserted at once
+            state: State of the import, for resuming (None to keep no state)
+            report_interval: Seconds between two progress reports
+        """
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.state = state or ImportState(None)
+        self.report_interval = report_interval
+        self.stats = {"files": 0, "skipped": 0, "imported": 0, "duplicates": 0, "invalid": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+        self._started = None
+        self._last_report = 0.0
+
+    def _count(self, key: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _insert_batch(self, batch: List[Tuple[str, str, Text]]) -> None:
+        """Insert the texts of a batch that are not stored yet, then record its files."""
+        existing = db.find_existing_hashes([content_hash for _, content_hash, _ in batch])
+        new_texts = [text for _, content_hash, text in batch if content_hash not in existing]
+        db.insert_text_models(new_texts, ordered=False)
+        self._count("imported", len(new_texts))
+        self._count("duplicates", len(batch) - len(new_texts))
+        self.state.mark([path for path, _, _ in batch])
+
+    def _report(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if not force and now - self._last_report < self.report_interval:
+            return
+        self._last_report = now
+        elapsed = max(now - self._started, 1e-9)
+        with self._stats_lock:
+            stats = dict(self.stats)
+        print(f"{stats['files']} files read, {stats['imported']} imported, {stats['duplicates']} duplicates, "
+              f"{stats['invalid']} invalid, {stats['failed']} failed - "
+              f"{stats['files'] / elapsed:.0f} files/s, {stats['imported'] / elapsed:.0f} texts/s")
+
+    def _collect(self, pending: set, block: bool) -> set:
+        """Wait for finished batches (at least one if block) and account for failures."""
+        done, pending = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if error is not None:
+                print(f"Batch failed: {error}")
+                self._count("failed", future.batch_size)
+        return pending
+
+    def run(self, directory: str) -> Dict[str, int]:
+        """
+        Import every JSON file below a directory.
+
+        Returns:
+            Counts of files read, skipped (already imported), texts
+            imported, duplicates, invalid files and failed texts
+        """
+        self._started = time.perf_counter()
+        self._last_report = self._started
+        backfilled = db.backfill_content_hashes(self.batch_size)
+        if backfilled:
+            print(f"Recorded the content hash of {backfilled} stored texts")
+
+        seen = set()
+        batch = []
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="import") as executor:
+            def submit(batch):
+                nonlocal pending
+                # Bound the batches held in memory
+                while len(pending) >= 2 * self.workers:
+                    pending = self._collect(pending, block=True)
+                future = executor.submit(self._insert_batch, batch)
+                future.batch_size = len(batch)
+                pending.add(future)
+
+            for path in iter_json_files(directory):
+                if path in self.state.done:
+                    self._count("skipped")
+                    continue
+                self._count("files")
+                try:
+                    text = load_text_file(path)
+                except (OSError, ValueError) as e:
+                    print(f"Skipping {path}: {e}")
+                    self._count("invalid")
+                    continue
+
+                content_hash = db.content_hash(text.content)
+                if content_hash in seen:
+                    self._count("duplicates")
+                    self.state.mark([path])
+                    continue
+                seen.add(content_hash)
+                batch.append((path, content_hash, text))
+                if len(batch) >= self.batch_size:
+                    submit(batch)
+                    batch = []
+                pending = self._collect(pending, block=False)
+                self._report()
+
+            if batch:
+                submit(batch)
+            while pending:
+                pending = self._collect(pending, block=True)
+
+        self._report(force=True)
+        return dict(self.stats)
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Bulk import saved QCM sets into MongoDB')
+    parser.add_argument('directory', nargs='?', default='Saved_qcms', help='Directory holding the JSON files')
+    parser.add_argument('--batch-size', '-b', type=int, default=IMPORT_BATCH_SIZE, help='Texts per insert')
+    parser.add_argument('--workers', '-w', type=int, default=IMPORT_WORKERS, help='Batches inserted at once')
+    parser.add_argument('--state', default=IMPORT_STATE_PATH, help='File recording the imported files')
+    parser.add_argument('--restart', action='store_true', help='Forget the files imported by previous runs')
+
+    args = parser.parse_args()
+
+    state = ImportState(args.state)
+    if args.restart:
+        state.reset()
+    try:
+        importer = BulkImporter(args.batch_size, args.workers, state)
+        importer.run(args.directory)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Linear-time, offset-based chunker for Arabic text.
+"""
+import os
+import re
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, Tuple
+
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "60"))
+
+# Sentence punctuation (Latin and Arabic) or a blank line ending a paragraph
+BOUNDARY_PATTERN = re.compile(r'[.!?؟،؛]+|(?P<paragraph>\n[ \t\r]*\n)')
+
+
+def normalize_chunk(text: str) -> str:
+    """Collapse the whitespace of a chunk into single spaces."""
+    return ' '.join(text.split())
+
+
+class Chunker:
+    def __init__(self, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+        """
+        Initialize an incremental chunker.
+
+        Text is fed in pieces and chunks come out as (start, end) offsets
+        into the concatenation of everything fed so far. Chunks end at
+        sentence punctuation when possible, at a paragraph break once they
+        are at least half full, and at whitespace when a sentence alone is
+        longer than chunk_size. Each chunk starts about overlap characters
+        before the end of the previous one, on a word boundary. Only the
+        unfinished chunk is buffered, and every character is scanned once.
+
+        Args:
+            chunk_size: Maximum chunk length in characters
+            overlap: Number of characters shared with the previous chunk
+        """
+        self.chunk_size = chunk_size
+        self.overlap = min(overlap, chunk_size // 2)
+
+        self._buffer = ""
+        self._base = 0            # Absolute offset of _buffer[0]
+        self._scan = 0            # Absolute offset where boundary search resumes
+        self._chunk_start = 0     # Absolute start of the chunk being built
+        self._last_boundary = 0   # Absolute end of the last complete sentence
+        self._emitted_end = 0     # Absolute end of the last emitted chunk
+
+    def _char(self, position: int) -> str:
+        return self._buffer[position - self._base]
+
+    def _emit(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """Trim a span and return it, unless it adds nothing to the last chunk."""
+        while start < end and self._char(start).isspace():
+            start += 1
+        while end > start and self._char(end - 1).isspace():
+            end -= 1
+        if end <= start or end <= self._emitted_end:
+            return []
+        self._emitted_end = end
+        return [(start, end)]
+
+    def _next_start(self, end: int) -> int:
+        """Start the next chunk overlap characters before end, on a word boundary."""
+        target = max(end - self.overlap, self._chunk_start + 1)
+        if target >= end:
+            return end
+        space = self._buffer.find(' ', target - self._base, end - self._base)
+        if space == -1:
+            newline = self._buffer.find('\n', target - self._base, end - self._base)
+            if newline == -1:
+                return end
+            space = newline
+        return space + self._base + 1
+
+    def _close_chunk(self, end: int) -> List[Tuple[int, int]]:
+        spans = self._emit(self._chunk_start, end)
+        self._chunk_start = self._next_start(end)
+        return spans
+
+    def _advance(self, limit: int) -> List[Tuple[int, int]]:
+        """Close chunks until the text up to limit fits in the current one."""
+        spans = []
+        while limit - self._chunk_start > self.chunk_size:
+            if self._last_boundary > self._chunk_start:
+                spans += self._close_chunk(self._last_boundary)
+                continue
+            # A single sentence longer than a chunk: cut at the last whitespace
+            window_end = self._chunk_start + self.chunk_size
+            lo, hi = self._chunk_start - self._base, window_end - self._base
+            cut = max(self._buffer.rfind(' ', lo, hi), self._buffer.rfind('\n', lo, hi))
+            cut = cut + self._base if cut > lo else window_end
+            spans += self._close_chunk(cut)
+        return spans
+
+    def feed(self, text: str) -> List[Tuple[int, int]]:
+        """
+        Add text and return the spans of the chunks it completes.
+
+        Args:
+            text: Next piece of the source text
+
+        Returns:
+            List of (start, end) absolute offsets
+        """
+        return [(start, end) for start, end, _ in self.feed_text(text)]
+
+    def feed_text(self, text: str) -> List[Tuple[int, int, str]]:
+        """Like feed, but also return the raw text of each completed chunk."""
+        self._buffer += text
+        buffer_end = self._base + len(self._buffer)
+        spans = []
+
+        for match in BOUNDARY_PATTERN.finditer(self._buffer, self._scan - self._base):
+            boundary = match.end() + self._base
+            # A boundary at the very end may continue in the next piece (e.g. "..")
+            if boundary == buffer_end:
+                break
+            if boundary - self._chunk_start > self.chunk_size:
+                spans += self._advance(boundary)
+            self._last_boundary = boundary
+            if match.lastgroup and boundary - self._chunk_start >= self.chunk_size // 2:
+                spans += self._close_chunk(boundary)
+            self._scan = boundary
+
+        # Bound the buffer even when a piece has no punctuation at all
+        spans += self._advance(buffer_end - self.chunk_size)
+        chunks = [(start, end, self._text(start, end)) for start, end in spans]
+
+        # Drop the text that no future chunk can include
+        keep_from = min(self._chunk_start, self._scan)
+        self._buffer = self._buffer[keep_from - self._base:]
+        self._base = keep_from
+        return chunks
+
+    def finish(self) -> List[Tuple[int, int]]:
+        """Return the spans of the remaining chunks once all text was fed."""
+        return [(start, end) for start, end, _ in self.finish_text()]
+
+    def finish_text(self) -> List[Tuple[int, int, str]]:
+        """Like finish, but also return the raw text of each chunk."""
+        buffer_end = self._base + len(self._buffer)
+        spans = self._advance(buffer_end)
+        spans += self._emit(self._chunk_start, buffer_end)
+        return [(start, end, self._text(start, end)) for start, end in spans]
+
+    def _text(self, start: int, end: int) -> str:
+        return self._buffer[start - self._base:end - self._base]
+
+
+def chunk_spans(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, int]]:
+    """
+    Split a text into chunk spans.
+
+    Args:
+        text: Source text
+        chunk_size: Maximum chunk length in characters
+        overlap: Number of characters shared between consecutive chunks
+
+    Returns:
+        List of (start, end) offsets into text
+    """
+    chunker = Chunker(chunk_size, overlap)
+    return chunker.feed(text) + chunker.finish()
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split a text into normalized chunks."""
+    return [normalize_chunk(text[start:end]) for start, end in chunk_spans(text, chunk_size, overlap)]
+
+
+def iter_page_chunks(pages: Iterable[Tuple[int, str]], chunk_size: int = CHUNK_SIZE,
+                     overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[str, int]]:
+    """
+    Chunk a stream of numbered pages incrementally.
+
+    Pages are joined with a newline, as extract_text_from_pdf does, so the
+    result matches chunk_text on the whole text.
+
+    Args:
+        pages: Iterable of (page number, page text)
+
+    Returns:
+        Iterator of (normalized chunk, page number where the chunk starts)
+    """
+    chunker = Chunker(chunk_size, overlap)
+    page_starts: List[int] = []
+    page_numbers: List[int] = []
+    offset = 0
+
+    def with_pages(chunks):
+        for start, _, text in chunks:
+            page = page_numbers[bisect_right(page_starts, start) - 1]
+            yield normalize_chunk(text), page
+
+    for page_number, page_text in pages:
+        page_starts.append(offset)
+        page_numbers.append(page_number)
+        piece = page_text + "\n"
+        offset += len(piece)
+        yield from with_pages(chunker.feed_text(piece))
+
+    if page_numbers:
+        yield from with_pages(chunker.finish_text())
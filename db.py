@@ -2,52 +2,197 @@
 MongoDB database integration for the Arabic QCM Generator.
 """
 import os
-from typing import List, Dict, Any, Optional
-from pymongo import MongoClient
-from bson import ObjectId
+import hashlib
+import threading
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from models import Text, QCM
 
-# Initialize MongoDB client
-client = MongoClient("mongodb://localhost:27017/")
-db = client["gen_qcm"]
-texts_collection = db["gen_qcm"]  # Use the students collection as specified
-counter_collection = db["counters"]
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+MONGODB_DATABASE = os.getenv("MONGODB_DATABASE", "gen_qcm")
+# How long an operation waits for the server before failing
+MONGODB_TIMEOUT_MS = int(os.getenv("MONGODB_TIMEOUT_MS", "5000"))
 
-# Initialize counter if it doesn't exist
-if "text_id" not in counter_collection.find_one({"_id": "counters"}, {"_id": 0}) if counter_collection.find_one({"_id": "counters"}) else {}:
-    counter_collection.update_one(
-        {"_id": "counters"},
-        {"$set": {"text_id": 0}},
-        upsert=True
-    )
+# Connection pool of the client
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "20"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_MS = int(os.getenv("MONGODB_MAX_IDLE_MS", "60000"))
+# How long an operation waits for a free pooled connection before failing
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "5000"))
 
-def get_next_text_id() -> int:
-    """Get the next sequential text ID and increment the counter."""
-    result = counter_collection.find_one_and_update(
-        {"_id": "counters"},
-        {"$inc": {"text_id": 1}},
-        return_document=True,
-        upsert=True
-    )
-    return result["text_id"]
+# Number of text IDs a process reserves from the counter at a time
+TEXT_ID_BLOCK_SIZE = int(os.getenv("TEXT_ID_BLOCK_SIZE", "100"))
 
-def save_text_with_qcms(text_content: str, level: int, difficulty: str, qcms: List[Dict[str, Any]]) -> str:
+# Fields left out of the summary view of a text
+SUMMARY_PROJECTION = {"content": 0, "qcms": 0, "content_hash": 0}
+
+# The client is created on first use, so importing this module never needs MongoDB
+_client = None
+_database = None
+_database_lock = threading.Lock()
+
+def _initialize_database(database) -> None:
+    """Initialize the text counter and the indexes of a database."""
+    # Initialize counter if it doesn't exist
+    counters = database["counters"].find_one({"_id": "counters"})
+    if counters is None or "text_id" not in counters:
+        database["counters"].update_one(
+            {"_id": "counters"},
+            {"$set": {"text_id": 0}},
+            upsert=True
+        )
+    ensure_indexes(database)
+
+def get_database():
     """
-    Save a text with its QCMs to MongoDB.
+    Get the MongoDB database, connecting on first use.
+    
+    The text counter is initialized on the first successful connection.
+    A failed attempt is not remembered, so the next call tries again
+    (e.g. once MongoDB has finished starting).
+    """
+    global _client, _database
+    with _database_lock:
+        if _database is None:
+            from pymongo import MongoClient
+            client = MongoClient(
+                MONGODB_URI,
+                serverSelectionTimeoutMS=MONGODB_TIMEOUT_MS,
+                maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                minPoolSize=MONGODB_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGODB_MAX_IDLE_MS,
+                waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS
+            )
+            database = client[MONGODB_DATABASE]
+            try:
+                _initialize_database(database)
+            except Exception:
+                client.close()
+                raise
+            _client, _database = client, database
+            print(f"Connected to MongoDB database {MONGODB_DATABASE}")
+        return _database
+
+def set_database(database, client=None) -> None:
+    """
+    Use the given database instead of connecting to MONGODB_URI.
+    
+    Lets tests run against a local mongod or an in-process stand-in with
+    the pymongo API (e.g. mongomock).
     
     Args:
-        text_content: The content of the text
-        level: The level of the text (1-6)
-        difficulty: The difficulty of the text (easy, medium, hard)
-        qcms: List of QCMs generated from the text
+        database: Database object to use
+        client: Optional client owning it, closed by close()
+    """
+    global _client, _database
+    _initialize_database(database)
+    with _database_lock:
+        _client, _database = client, database
+
+def pool_options() -> Dict[str, int]:
+    """Get the connection pool settings of the client."""
+    return {
+        "max_pool_size": MONGODB_MAX_POOL_SIZE,
+        "min_pool_size": MONGODB_MIN_POOL_SIZE,
+        "max_idle_ms": MONGODB_MAX_IDLE_MS,
+        "wait_queue_timeout_ms": MONGODB_WAIT_QUEUE_TIMEOUT_MS
+    }
+
+def ensure_indexes(database) -> None:
+    """Create the indexes backing the filters of the text listing (no-op if they exist)."""
+    texts = database["gen_qcm"]
+    # Filters on level and difficulty, paginated by _id
+    texts.create_index([("level", 1), ("difficulty", 1), ("_id", 1)])
+    # Filters on level alone (the index above would scan every difficulty to sort by _id)
+    texts.create_index([("level", 1), ("_id", 1)])
+    # Filters on difficulty alone
+    texts.create_index([("difficulty", 1), ("_id", 1)])
+    # Duplicate detection on import (not unique: older databases may hold duplicates)
+    texts.create_index("content_hash")
+
+def get_texts_collection():
+    """Get the collection holding the texts and their QCMs."""
+    return get_database()["gen_qcm"]  # Use the students collection as specified
+
+def get_counter_collection():
+    """Get the collection holding the sequential ID counters."""
+    return get_database()["counters"]
+
+def ping() -> bool:
+    """Check whether MongoDB is reachable, connecting if needed."""
+    try:
+        get_database().command("ping")
+        return True
+    except Exception as e:
+        print(f"MongoDB is not reachable: {e}")
+        return False
+
+def close() -> None:
+    """Close the MongoDB connection, if one was opened."""
+    global _client, _database
+    with _database_lock:
+        if _client is not None:
+            _client.close()
+        _client, _database = None, None
+
+def reserve_text_ids(count: int) -> int:
+    """
+    Reserve count sequential text IDs with a single counter update.
     
     Returns:
-        The ID of the saved text
+        The first reserved ID (the others follow it)
     """
-    # Get the next sequential ID
-    text_id = get_next_text_id()
+    result = get_counter_collection().find_one_and_update(
+        {"_id": "counters"},
+        {"$inc": {"text_id": count}},
+        return_document=True,
+        upsert=True
+    )
+    return result["text_id"] - count + 1
+
+class TextIdAllocator:
+    def __init__(self, block_size: int = TEXT_ID_BLOCK_SIZE):
+        """
+        Initialize the text ID allocator.
+        
+        IDs are reserved from the shared counter in blocks of block_size
+        and handed out locally, so most saves do not touch the counter.
+        Each worker process gets its own blocks, so IDs are unique across
+        workers and increasing within each of them. IDs left in the block
+        of a worker that stops are never used.
+        
+        Args:
+            block_size: Number of IDs reserved per counter update
+        """
+        self.block_size = max(1, block_size)
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
     
-    # Format QCMs to match our schema
+    def allocate(self, count: int = 1) -> int:
+        """
+        Allocate count consecutive IDs.
+        
+        Returns:
+            The first allocated ID (the others follow it)
+        """
+        with self._lock:
+            if self._end - self._next < count:
+                # The rest of the current block is skipped when it is too small
+                size = max(self.block_size, count)
+                first_id = reserve_text_ids(size)
+                self._next, self._end = first_id, first_id + size
+            first_id = self._next
+            self._next += count
+            return first_id
+
+_text_ids = TextIdAllocator()
+
+def get_next_text_id() -> int:
+    """Get the next sequential text ID, reserving a new block from the counter when needed."""
+    return _text_ids.allocate()
+
+def format_qcms(qcms: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Convert generated QCMs (question, correct_answer, choices) to the stored schema."""
     formatted_qcms = []
     for qcm in qcms:
         # Extract the correct answer and wrong answers
@@ -67,28 +212,174 @@ def save_text_with_qcms(text_content: str, level: int, difficulty: str, qcms: Li
             "wrong_answer3": wrong_answers[2] if len(wrong_answers) > 2 else "لا إجابة"
         }
         formatted_qcms.append(formatted_qcm)
-    
-    # Create text document
-    text_doc = {
+    return formatted_qcms
+
+def content_hash(text_content: str) -> str:
+    """Hash a text content, ignoring differences in whitespace."""
+    return hashlib.sha256(" ".join(text_content.split()).encode("utf-8")).hexdigest()
+
+def build_text_document(text_id: int, text_content: str, level: int, difficulty: str,
+                        qcms: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the stored document of a text and its generated QCMs."""
+    return {
         "_id": text_id,
         "content": text_content,
         "level": level,
         "difficulty": difficulty,
-        "qcms": formatted_qcms
+        "qcms": format_qcms(qcms),
+        "content_hash": content_hash(text_content)
     }
+
+def text_from_json(data: Dict[str, Any]) -> Text:
+    """
+    Validate a text loaded from JSON.
     
-    # Insert into MongoDB
-    texts_collection.insert_one(text_doc)
+    Accepts both the stored shape (content and qcms with wrong answers,
+    as written by write_text_json) and the generated shape (text_content
+    and questions with choices). Stored IDs are not kept.
+    
+    Args:
+        data: Parsed JSON object
+    
+    Returns:
+        The validated text
     
-    # Return the ID
-    return str(text_id)
+    Raises:
+        ValueError: If the object has neither shape or fails validation
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    if "content" in data:
+        content, qcms = data["content"], data.get("qcms", [])
+    elif "text_content" in data:
+        content = data["text_content"]
+        try:
+            qcms = format_qcms(data.get("questions", []))
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid question: {e}")
+    else:
+        raise ValueError("Expected a content or text_content field")
+    # pydantic's ValidationError is a ValueError
+    return Text(content=content, level=data.get("level", 1), difficulty=data.get("difficulty", "medium"), qcms=qcms)
 
-def save_text_to_json(text_id: str, output_path: Optional[str] = None) -> str:
+def insert_text_models(texts: List[Text], ordered: bool = True) -> List[Dict[str, Any]]:
     """
-    Save a text and its QCMs to a JSON file.
+    Save many validated texts using at most one counter update and one insert.
     
     Args:
-        text_id: The ID of the text in MongoDB
+        texts: Validated texts, whose QCMs are already in the stored schema
+        ordered: Stop at the first failed document instead of trying them all
+    
+    Returns:
+        The saved documents, in the same order
+    """
+    if not texts:
+        return []
+    first_id = _text_ids.allocate(len(texts))
+    text_docs = []
+    for i, text in enumerate(texts):
+        qcms = [
+            {
+                "question": qcm.question,
+                "correct_answer": qcm.correct_answer,
+                "wrong_answer1": qcm.wrong_answer1,
+                "wrong_answer2": qcm.wrong_answer2,
+                "wrong_answer3": qcm.wrong_answer3
+            }
+            for qcm in text.qcms
+        ]
+        text_docs.append({
+            "_id": first_id + i,
+            "content": text.content,
+            "level": text.level,
+            "difficulty": text.difficulty,
+            "qcms": qcms,
+            "content_hash": content_hash(text.content)
+        })
+    get_texts_collection().insert_many(text_docs, ordered=ordered)
+    return text_docs
+
+def find_existing_hashes(hashes: List[str]) -> set:
+    """Return which of the given content hashes are already stored."""
+    if not hashes:
+        return set()
+    cursor = get_texts_collection().find({"content_hash": {"$in": list(hashes)}}, {"content_hash": 1})
+    return {doc["content_hash"] for doc in cursor}
+
+def backfill_content_hashes(batch_size: int = 500) -> int:
+    """
+    Store the content hash of texts saved before it was recorded.
+    
+    Returns:
+        The number of texts updated
+    """
+    from pymongo import UpdateOne
+    
+    texts = get_texts_collection()
+    cursor = texts.find({"content_hash": {"$exists": False}}, {"content": 1}).batch_size(batch_size)
+    updated = 0
+    updates = []
+    for doc in cursor:
+        updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"content_hash": content_hash(doc.get("content", ""))}}))
+        if len(updates) >= batch_size:
+            updated += texts.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        updated += texts.bulk_write(updates, ordered=False).modified_count
+    return updated
+
+def insert_text(text_content: str, level: int, difficulty: str, qcms: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Save a text with its QCMs to MongoDB.
+    
+    Args:
+        text_content: The content of the text
+        level: The level of the text (1-6)
+        difficulty: The difficulty of the text (easy, medium, hard)
+        qcms: List of QCMs generated from the text
+    
+    Returns:
+        The saved document
+    """
+    text_doc = build_text_document(get_next_text_id(), text_content, level, difficulty, qcms)
+    get_texts_collection().insert_one(text_doc)
+    return text_doc
+
+def insert_texts(text_sets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Save many texts with their QCMs using at most one counter update and one insert.
+    
+    Args:
+        text_sets: Dicts with text_content, level, difficulty and questions
+    
+    Returns:
+        The saved documents, in the same order
+    """
+    if not text_sets:
+        return []
+    first_id = _text_ids.allocate(len(text_sets))
+    text_docs = [
+        build_text_document(first_id + i, item["text_content"], item["level"], item["difficulty"], item["questions"])
+        for i, item in enumerate(text_sets)
+    ]
+    get_texts_collection().insert_many(text_docs, ordered=True)
+    return text_docs
+
+def save_text_with_qcms(text_content: str, level: int, difficulty: str, qcms: List[Dict[str, Any]]) -> str:
+    """
+    Save a text with its QCMs to MongoDB.
+    
+    Returns:
+        The ID of the saved text
+    """
+    return str(insert_text(text_content, level, difficulty, qcms)["_id"])
+
+def write_text_json(text_doc: Dict[str, Any], output_path: Optional[str] = None) -> str:
+    """
+    Write a text document and its QCMs to a JSON file in Saved_qcms.
+    
+    Args:
+        text_doc: The text document, as stored in MongoDB
         output_path: Optional path to save the JSON file
     
     Returns:
@@ -96,17 +387,12 @@ def save_text_to_json(text_id: str, output_path: Optional[str] = None) -> str:
     """
     import json
     
-    # Get the text from MongoDB
-    text_doc = texts_collection.find_one({"_id": int(text_id)})
-    if not text_doc:
-        raise ValueError(f"Text with ID {text_id} not found")
-    
     # Ensure Saved_qcms directory exists
     os.makedirs("Saved_qcms", exist_ok=True)
     
     # Generate output path if not provided
     if not output_path:
-        output_path = f"text_{text_id}.json"
+        output_path = f"text_{text_doc['_id']}.json"
     
     # Add directory prefix to path if not already specified
     if not output_path.startswith("Saved_qcms/"):
@@ -118,14 +404,69 @@ def save_text_to_json(text_id: str, output_path: Optional[str] = None) -> str:
     
     return output_path
 
+def save_text_to_json(text_id: str, output_path: Optional[str] = None) -> str:
+    """
+    Save a text stored in MongoDB and its QCMs to a JSON file.
+    
+    Args:
+        text_id: The ID of the text in MongoDB
+        output_path: Optional path to save the JSON file
+    
+    Returns:
+        The path to the saved JSON file
+    """
+    return write_text_json(get_text_by_id(text_id), output_path)
+
 def get_all_texts() -> List[Dict[str, Any]]:
     """Get all texts from MongoDB."""
-    texts = list(texts_collection.find())
+    texts = list(get_texts_collection().find())
     return texts
 
+def _text_filter(level: Optional[int] = None, difficulty: Optional[str] = None) -> Dict[str, Any]:
+    query = {}
+    if level is not None:
+        query["level"] = level
+    if difficulty is not None:
+        query["difficulty"] = difficulty
+    return query
+
+def list_texts(after: Optional[int] = None, limit: int = 50, level: Optional[int] = None,
+               difficulty: Optional[str] = None, summary: bool = True) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Get one page of texts, in ID order.
+    
+    Args:
+        after: ID of the last text of the previous page (None for the first page)
+        limit: Maximum number of texts returned
+        level: Only return texts of this level
+        difficulty: Only return texts of this difficulty
+        summary: Leave out the content and QCMs of the texts
+    
+    Returns:
+        The texts, and the cursor of the next page (None on the last page)
+    """
+    query = _text_filter(level, difficulty)
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    projection = SUMMARY_PROJECTION if summary else None
+    
+    # Fetch one extra text to know whether there is a next page
+    texts = list(get_texts_collection().find(query, projection).sort("_id", 1).limit(limit + 1))
+    if len(texts) > limit:
+        texts = texts[:limit]
+        return texts, texts[-1]["_id"]
+    return texts, None
+
+def iter_texts(level: Optional[int] = None, difficulty: Optional[str] = None, summary: bool = False,
+               batch_size: int = 100) -> Iterator[Dict[str, Any]]:
+    """Iterate over all matching texts in ID order, fetching batch_size at a time."""
+    projection = SUMMARY_PROJECTION if summary else None
+    cursor = get_texts_collection().find(_text_filter(level, difficulty), projection).sort("_id", 1)
+    yield from cursor.batch_size(batch_size)
+
 def get_text_by_id(text_id: str) -> Dict[str, Any]:
     """Get a text by its ID."""
-    text = texts_collection.find_one({"_id": int(text_id)})
+    text = get_texts_collection().find_one({"_id": int(text_id)})
     if not text:
         raise ValueError(f"Text with ID {text_id} not found")
     return text
@@ -135,7 +476,7 @@ def import_text_from_json(json_path: str) -> str:
     Import a text from a JSON file into MongoDB.
     
     Args:
-        json_path: Path to the JSON file
+        json_path: Path to the JSON file, in the stored or generated shape (see text_from_json)
         
     Returns:
         The ID of the imported text
@@ -146,11 +487,5 @@ def import_text_from_json(json_path: str) -> str:
     with open(json_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
     
-    # Extract text content, level, difficulty, and questions
-    text_content = data.get("text_content", "")
-    level = data.get("level", 1)
-    difficulty = data.get("difficulty", "medium")
-    questions = data.get("questions", [])
-    
     # Save to MongoDB
-    return save_text_with_qcms(text_content, level, difficulty, questions)
\ No newline at end of file
+    return str(insert_text_models([text_from_json(data)])[0]["_id"])
\ No newline at end of file
@@ -6,17 +6,22 @@ import numpy as np
 import faiss
 from typing import List, Dict, Any
 from sentence_transformers import SentenceTransformer
+from embedding_cache import EmbeddingCache, get_default_cache
+from vector_index import build_index, configure_search
 
 class ArabicEmbedder:
-    def __init__(self, model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"):
+    def __init__(self, model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+                 cache: EmbeddingCache = None):
         """
         Initialize the Arabic text embedder.
         
         Args:
             model_name: Name of the embedding model to use
+            cache: Embedding cache to consult (defaults to the shared cache)
         """
         self.model_name = model_name
         self.model = SentenceTransformer(model_name)
+        self.cache = cache if cache is not None else get_default_cache()
         self.index = None
         self.chunks = []
     
@@ -30,7 +35,25 @@ class ArabicEmbedder:
         Returns:
             Array of embeddings
         """
-        return self.model.encode(texts, show_progress_bar=True)
+        cached = self.cache.get_many(self.model_name, texts)
+        missing = [i for i in range(len(texts)) if i not in cached]
+        
+        if missing:
+            new_embeddings = self.model.encode([texts[i] for i in missing], show_progress_bar=True)
+            new_embeddings = np.asarray(new_embeddings, dtype='float32')
+            self.cache.put_many(self.model_name, [texts[i] for i in missing], new_embeddings)
+            dimension = new_embeddings.shape[1]
+        elif cached:
+            dimension = next(iter(cached.values())).shape[0]
+        else:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype='float32')
+        
+        embeddings = np.zeros((len(texts), dimension), dtype='float32')
+        for i, vector in cached.items():
+            embeddings[i] = vector
+        if missing:
+            embeddings[missing] = new_embeddings
+        return embeddings
     
     def create_index(self, texts: List[str]) -> None:
         """
@@ -42,14 +65,8 @@ class ArabicEmbedder:
         self.chunks = texts
         embeddings = self.embed_texts(texts)
         
-        # Get embedding dimension
-        dimension = embeddings.shape[1]
-        
-        # Create FAISS index
-        self.index = faiss.IndexFlatL2(dimension)
-        
-        # Add embeddings to the index
-        self.index.add(embeddings.astype('float32'))
+        # Create a FAISS index suited to the number of chunks
+        self.index = build_index(embeddings)
         
         print(f"Created index with {len(texts)} chunks")
     
@@ -83,7 +100,7 @@ class ArabicEmbedder:
             chunks_path: Path to the saved chunks
         """
         # Load the index
-        self.index = faiss.read_index(index_path)
+        self.index = configure_search(faiss.read_index(index_path))
         
         # Load the chunks
         with open(chunks_path, 'r', encoding='utf-8') as f:
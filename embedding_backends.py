@@ -0,0 +1,143 @@
+"""
+Embedding backends used by the diacritized QCM generator.
+"""
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional
+import numpy as np
+from llm_gateway import LLMGateway, BULK
+
+# "openai" (remote text-embedding-ada-002) or "local" (SentenceTransformer on CPU)
+EMBEDDING_BACKENDS = ("openai", "local")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+OPENAI_EMBEDDING_DIM = 1536  # Ada-002 embedding size
+
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL",
+                                  "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", str(os.cpu_count() or 1)))
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+# "torch", "quantized" (int8 dynamic quantization) or "onnx" (needs sentence-transformers>=3.2)
+LOCAL_EMBEDDING_RUNTIMES = ("torch", "quantized", "onnx")
+LOCAL_EMBEDDING_RUNTIME = os.getenv("LOCAL_EMBEDDING_RUNTIME", "torch")
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interface of an embedding backend.
+
+    Attributes:
+        name: Identifier of the model, used as the embedding cache key
+        dimension: Size of the vectors produced
+        max_concurrency: Maximum number of batches worth embedding at
+            once, or None for no limit beyond the caller's
+    """
+    name: str
+    dimension: int
+    max_concurrency: Optional[int] = None
+
+    @abstractmethod
+    def embed_batch(self, texts: List[str], priority: str = BULK) -> np.ndarray:
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts: Texts to embed
+            priority: INTERACTIVE or BULK, for backends that share a rate limit
+
+        Returns:
+            Array of shape (len(texts), dimension)
+        """
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    def __init__(self, gateway: LLMGateway, model: str = OPENAI_EMBEDDING_MODEL):
+        """
+        Initialize the OpenAI embedding backend.
+
+        Args:
+            gateway: LLM gateway used for the requests
+            model: OpenAI embedding model
+        """
+        self.gateway = gateway
+        self.name = model
+        self.dimension = OPENAI_EMBEDDING_DIM
+
+    def embed_batch(self, texts: List[str], priority: str = BULK) -> np.ndarray:
+        """Embed a batch of texts in a single request, retried by the gateway."""
+        response = self.gateway.embedding(texts, priority=priority, model=self.name)
+        # The API does not guarantee ordering, so sort by index
+        data = sorted(response.data, key=lambda item: item.index)
+        if len(data) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(data)}")
+        return np.array([item.embedding for item in data], dtype='float32')
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    def __init__(self, model_name: str = LOCAL_EMBEDDING_MODEL, num_threads: int = LOCAL_EMBEDDING_THREADS,
+                 batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE, runtime: str = LOCAL_EMBEDDING_RUNTIME):
+        """
+        Initialize a local SentenceTransformer embedding backend.
+
+        The model runs on CPU in this process, so embedding needs neither
+        network access nor API calls. The vector size is read from the
+        model.
+
+        Args:
+            model_name: SentenceTransformer model name or path
+            num_threads: Number of CPU threads used by torch
+            batch_size: Number of texts encoded per forward pass
+            runtime: "torch", "quantized" or "onnx"
+        """
+        if runtime not in LOCAL_EMBEDDING_RUNTIMES:
+            raise ValueError(f"Unknown local embedding runtime: {runtime}")
+
+        # Heavy optional dependencies, only needed for this backend
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        torch.set_num_threads(max(1, num_threads))
+        if runtime == "onnx":
+            try:
+                model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+            except TypeError:
+                raise ValueError("The onnx runtime needs sentence-transformers>=3.2 with its onnx extra")
+        else:
+            model = SentenceTransformer(model_name, device="cpu")
+            if runtime == "quantized":
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        self.model = model
+        self.batch_size = batch_size
+        # Quantized or ONNX vectors differ slightly, so they get their own cache entries
+        self.name = model_name if runtime == "torch" else f"{model_name}:{runtime}"
+        self.dimension = model.get_sentence_embedding_dimension()
+        # torch already uses every thread for one batch
+        self.max_concurrency = 1
+        print(f"Loaded local embedding model {self.name} ({self.dimension} dimensions, {num_threads} threads)")
+
+    def embed_batch(self, texts: List[str], priority: str = BULK) -> np.ndarray:
+        """Embed a batch of texts with the local model."""
+        vectors = self.model.encode(texts, batch_size=self.batch_size, show_progress_bar=False,
+                                    convert_to_numpy=True)
+        return np.asarray(vectors, dtype='float32').reshape(len(texts), self.dimension)
+
+
+def create_embedding_backend(backend: str = None, gateway: LLMGateway = None) -> EmbeddingBackend:
+    """
+    Create the embedding backend selected by name (defaults to EMBEDDING_BACKEND).
+
+    Args:
+        backend: "openai" or "local"
+        gateway: LLM gateway, required by the openai backend
+
+    Returns:
+        The embedding backend
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    if backend == "local":
+        return LocalEmbeddingBackend()
+    return OpenAIEmbeddingBackend(gateway)
@@ -0,0 +1,290 @@
+"""
+Persistent, content-addressed cache for text embeddings.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, List, Dict, Optional
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite")
+DEFAULT_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024
+# Eviction frees space down to this fraction of the maximum size, so it runs rarely
+EVICTION_LOW_WATER = float(os.getenv("EMBEDDING_CACHE_LOW_WATER", "0.9"))
+# Cache hits whose access time is recorded in one write
+ACCESS_FLUSH_SIZE = 256
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_CACHE_DISK = os.getenv("QUERY_EMBEDDING_CACHE_DISK", "true").lower() in ("1", "true", "yes")
+
+
+def text_hash(text: str) -> str:
+    """Return the SHA-256 hex digest of a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_query(text: str) -> str:
+    """Normalize a query so spacing differences map to the same cache entry."""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Initialize the embedding cache.
+
+        Vectors are stored as raw float32 blobs in SQLite, keyed by
+        (embedding model, SHA-256 of the text). When the stored size goes
+        over max_bytes, the least recently used entries are evicted.
+
+        Args:
+            path: Path to the SQLite database file
+            max_bytes: Maximum total size of the stored vectors
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        # Running size of the stored vectors, so writes need not sum the whole table
+        self._total_bytes = self._size_bytes()
+        # Access times of cache hits not written yet, keyed by (model, hash)
+        self._pending_access: Dict[tuple, float] = {}
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        """
+        Look up cached embeddings for a list of texts.
+
+        Args:
+            model: Name of the embedding model
+            texts: Texts to look up
+
+        Returns:
+            Mapping from position in texts to its cached vector
+        """
+        hashes = [text_hash(text) for text in texts]
+        positions: Dict[str, List[int]] = {}
+        for i, h in enumerate(hashes):
+            positions.setdefault(h, []).append(i)
+
+        found = {}
+        unique = list(positions)
+        with self._lock:
+            # Stay under SQLite's bound parameter limit
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *part]
+                ).fetchall()
+                for h, blob in rows:
+                    vector = np.frombuffer(blob, dtype='float32')
+                    for i in positions[h]:
+                        found[i] = vector
+            if found:
+                now = time.time()
+                for i in found:
+                    self._pending_access[(model, hashes[i])] = now
+                if len(self._pending_access) >= ACCESS_FLUSH_SIZE:
+                    self._flush_access()
+        return found
+
+    def _flush_access(self) -> None:
+        """Write the access times of recent cache hits, which only matter for eviction order."""
+        if not self._pending_access:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE model = ? AND hash = ?",
+            [(now, model, h) for (model, h), now in self._pending_access.items()]
+        )
+        self._conn.commit()
+        self._pending_access = {}
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """Look up the cached embedding of a single text."""
+        return self.get_many(model, [text]).get(0)
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray) -> None:
+        """
+        Store embeddings for a list of texts.
+
+        Args:
+            model: Name of the embedding model
+            texts: Texts that were embedded
+            vectors: Array of embeddings, one row per text
+        """
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            vector = np.asarray(vector, dtype='float32')
+            h = text_hash(text)
+            rows[h] = (model, h, vector.shape[0], vector.tobytes(), now)
+        with self._lock:
+            # Replaced vectors no longer count towards the total
+            replaced_bytes = 0
+            unique = list(rows)
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                replaced_bytes += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *part]
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, dim, vector, last_access) VALUES (?, ?, ?, ?, ?)",
+                list(rows.values())
+            )
+            self._conn.commit()
+            self._total_bytes += sum(len(row[3]) for row in rows.values()) - replaced_bytes
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def put(self, model: str, text: str, vector: np.ndarray) -> None:
+        """Store the embedding of a single text."""
+        self.put_many(model, [text], np.asarray(vector).reshape(1, -1))
+
+    def size_bytes(self) -> int:
+        """Return the total size of the stored vectors."""
+        with self._lock:
+            self._total_bytes = self._size_bytes()
+            return self._total_bytes
+
+    def _size_bytes(self) -> int:
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        return row[0]
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is back under the low-water mark."""
+        excess = self._total_bytes - int(self.max_bytes * EVICTION_LOW_WATER)
+        if excess <= 0:
+            return
+        self._flush_access()
+        rows = self._conn.execute(
+            "SELECT model, hash, LENGTH(vector) FROM embeddings ORDER BY last_access"
+        )
+        victims = []
+        for model, h, size in rows:
+            if excess <= 0:
+                break
+            victims.append((model, h))
+            excess -= size
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND hash = ?", victims)
+        self._conn.commit()
+        print(f"Evicted {len(victims)} embeddings from cache")
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._flush_access()
+            self._conn.close()
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, disk_cache: Optional[EmbeddingCache] = None):
+        """
+        Initialize the query embedding cache.
+
+        Query vectors live in an in-memory LRU of max_entries items keyed
+        by (embedding model, normalized query). When disk_cache is given,
+        misses fall through to it and new vectors are written to it, so
+        other processes and restarts share the queries already embedded.
+
+        Args:
+            max_entries: Maximum number of vectors kept in memory
+            disk_cache: Optional persistent cache used as a second tier
+        """
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def get(self, model: str, query: str) -> Optional[np.ndarray]:
+        """Return the cached embedding of a query, or None."""
+        query = normalize_query(query)
+        key = (model, query)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return vector
+
+        vector = self.disk_cache.get(model, query) if self.disk_cache is not None else None
+        with self._lock:
+            if vector is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._remember(key, vector)
+            return vector
+
+    def put(self, model: str, query: str, vector: np.ndarray) -> None:
+        """Store the embedding of a query in both tiers."""
+        query = normalize_query(query)
+        vector = np.asarray(vector, dtype='float32')
+        with self._lock:
+            self._remember((model, query), vector)
+        if self.disk_cache is not None:
+            self.disk_cache.put(model, query, vector)
+
+    def _remember(self, key, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit and miss counters with the overall hit rate."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+_default_query_cache = None
+
+
+def get_default_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    """Return the process-wide query embedding cache, backed by the default cache if QUERY_EMBEDDING_CACHE_DISK is on."""
+    global _default_query_cache
+    disk_cache = get_default_cache() if QUERY_CACHE_DISK else None
+    with _default_cache_lock:
+        if _default_query_cache is None:
+            _default_query_cache = QueryEmbeddingCache(disk_cache=disk_cache)
+        return _default_query_cache
@@ -1,3 +1,11 @@
+"""
+Sample QCM JSON generator.
+
+The sample is not a saved text (it has no content, level or difficulty),
+so it is written to its own qcm_<timestamp>.json file rather than to the
+QCM archive, whose records are keyed by text ID. Saved texts go to the
+archive (see qcm_archive).
+"""
 import json
 import os
 from datetime import datetime
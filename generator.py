@@ -4,8 +4,8 @@ QCM generator module for Arabic text.
 import json
 import os
 from typing import List, Dict, Any
-import openai
 from dotenv import load_dotenv
+from llm_gateway import LLMGateway, get_gateway
 
 # Load environment variables
 load_dotenv()
@@ -16,18 +16,27 @@ class ArabicQCMGenerator:
         Initialize the Arabic QCM generator.
         
         Args:
-            api_key: OpenAI API key (if None, will try to get from environment)
+            api_key: OpenAI API key (if None, uses the shared gateway configured from the environment)
             model: OpenAI model to use
         """
-        # Get API key from environment if not provided
         if api_key is None:
-            api_key = os.getenv("OPENAI_API_KEY")
-            if api_key is None:
+            if os.getenv("OPENAI_API_KEY") is None:
                 raise ValueError("OpenAI API key not provided and not found in environment")
+            self.gateway = get_gateway()
+            self._owns_gateway = False
+        else:
+            # A dedicated key has its own OpenAI quota, so it gets its own
+            # buckets and connection pool, released by close()
+            self.gateway = LLMGateway(api_key=api_key)
+            self._owns_gateway = True
         
-        openai.api_key = api_key
         self.model = model
     
+    def close(self) -> None:
+        """Close the gateway created for a dedicated API key (the shared one is left open)."""
+        if self._owns_gateway:
+            self.gateway.close()
+    
     def generate_qcm(self, text_chunk: str) -> Dict[str, Any]:
         """
         Generate a QCM from a text chunk using OpenAI.
@@ -61,7 +70,7 @@ class ArabicQCMGenerator:
 تأكد من أن الجواب الصحيح موجود في قائمة الخيارات، وأن الخيارات مرتبة بشكل عشوائي."""
 
         try:
-            response = openai.ChatCompletion.create(
+            response = self.gateway.chat_completion(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "أنت مساعد متخصص في إنشاء أسئلة اختيار من متعدد باللغة العربية من النصوص التعليمية."},
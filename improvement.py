@@ -0,0 +1,305 @@
+"""
+Improvement of generated Arabic QCMs with OpenAI.
+"""
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Callable, Optional
+from llm_gateway import LLMGateway, INTERACTIVE
+from result_cache import get_result_cache, make_key
+
+IMPROVEMENT_MODEL = "gpt-4o-mini"
+IMPROVEMENT_MAX_CONCURRENCY = int(os.getenv("IMPROVEMENT_MAX_CONCURRENCY", "5"))
+
+# Bump when the improvement prompts change so cached results are not reused
+IMPROVEMENT_PROMPT_VERSION = "1"
+
+# "per_question" sends one request per QCM, "batch" sends the whole set at once
+IMPROVEMENT_MODES = ("per_question", "batch")
+IMPROVEMENT_MODE = os.getenv("IMPROVEMENT_MODE", "per_question")
+
+# Output tokens budgeted per question in batch mode, and the model's output cap
+IMPROVEMENT_TOKENS_PER_QUESTION = 1000
+IMPROVEMENT_MAX_OUTPUT_TOKENS = int(os.getenv("IMPROVEMENT_MAX_OUTPUT_TOKENS", "16384"))
+
+IMPROVEMENT_SYSTEM_PROMPT = "أنت مساعد متخصص في تحسين أسئلة الاختيار من متعدد باللغة العربية مع التشكيل الكامل."
+
+
+def build_improvement_prompt(text: str, qcm: Dict[str, Any]) -> str:
+    """Build the prompt asking to improve one QCM based on its source text."""
+    return f"""
+أنا بحاجة إلى تحسين سؤال اختيار من متعدد (QCM) بناءً على النص التالي:
+
+النص:
+{text}
+
+السؤال الحالي:
+{qcm["question"]}
+
+الإجابة الصحيحة:
+{qcm["correct_answer"]}
+
+الخيارات:
+{", ".join(qcm["choices"])}
+
+يرجى تحسين السؤال والإجابات مع مراعاة ما يلي:
+1. تأكد من أن السؤال والإجابات مرتبطة بالنص المقدم فقط.
+2. تأكد من التشكيل الكامل لجميع الكلمات.
+3. تأكد من صحة اللغة والنحو.
+4. تأكد من أن الضمائر والسياق متناسقة.
+5. تأكد من أن الإجابة الصحيحة واضحة وغير ملتبسة.
+6. تأكد من أن الخيارات الخاطئة معقولة ولكن غير صحيحة بوضوح.
+
+أعطني السؤال المحسن بتنسيق JSON كما يلي:
+{{
+  "question": "السؤال المحسن مع التشكيل الكامل",
+  "correct_answer": "الإجابة الصحيحة المحسنة مع التشكيل الكامل",
+  "choices": [
+    "الخيار الأول",
+    "الخيار الثاني",
+    "الخيار الثالث",
+    "الخيار الرابع"
+  ]
+}}
+
+تأكد من أن الإجابة الصحيحة موجودة في قائمة الخيارات.
+"""
+
+
+def build_batch_improvement_prompt(text: str, qcms: List[Dict[str, Any]]) -> str:
+    """Build the prompt asking to improve a whole list of QCMs in one request."""
+    questions = [
+        {
+            "index": i,
+            "question": qcm["question"],
+            "correct_answer": qcm["correct_answer"],
+            "choices": qcm["choices"]
+        }
+        for i, qcm in enumerate(qcms)
+    ]
+    return f"""
+أنا بحاجة إلى تحسين قائمة أسئلة اختيار من متعدد (QCM) بناءً على النص التالي:
+
+النص:
+{text}
+
+الأسئلة الحالية:
+{json.dumps(questions, ensure_ascii=False, indent=2)}
+
+يرجى تحسين كل سؤال وإجاباته مع مراعاة ما يلي:
+1. تأكد من أن السؤال والإجابات مرتبطة بالنص المقدم فقط.
+2. تأكد من التشكيل الكامل لجميع الكلمات.
+3. تأكد من صحة اللغة والنحو.
+4. تأكد من أن الضمائر والسياق متناسقة.
+5. تأكد من أن الإجابة الصحيحة واضحة وغير ملتبسة.
+6. تأكد من أن الخيارات الخاطئة معقولة ولكن غير صحيحة بوضوح.
+
+أعطني الأسئلة المحسنة بتنسيق JSON كما يلي، مع الاحتفاظ بنفس قيمة "index" لكل سؤال:
+{{
+  "questions": [
+    {{
+      "index": 0,
+      "question": "السؤال المحسن مع التشكيل الكامل",
+      "correct_answer": "الإجابة الصحيحة المحسنة مع التشكيل الكامل",
+      "choices": [
+        "الخيار الأول",
+        "الخيار الثاني",
+        "الخيار الثالث",
+        "الخيار الرابع"
+      ]
+    }}
+  ]
+}}
+
+أعد جميع الأسئلة ({len(qcms)} أسئلة) وتأكد من أن الإجابة الصحيحة موجودة في قائمة الخيارات لكل سؤال.
+"""
+
+
+def improve_qcm(gateway: LLMGateway, text: str, qcm: Dict[str, Any], force_fresh: bool = False) -> Dict[str, Any]:
+    """
+    Improve a single QCM.
+
+    Args:
+        gateway: LLM gateway used for the requests
+        text: Source text of the question
+        qcm: Question with question, correct_answer and choices
+        force_fresh: Skip the result cache lookup
+
+    Returns:
+        The improved question
+    """
+    result_cache = get_result_cache()
+    cache_key = make_key("improvement", text, qcm=qcm, model=IMPROVEMENT_MODEL,
+                         prompt_version=IMPROVEMENT_PROMPT_VERSION)
+    if result_cache is not None and not force_fresh:
+        cached_qcm = result_cache.get(cache_key)
+        if cached_qcm is not None:
+            return cached_qcm
+
+    response = gateway.chat_completion(
+        priority=INTERACTIVE,
+        model=IMPROVEMENT_MODEL,
+        messages=[
+            {"role": "system", "content": IMPROVEMENT_SYSTEM_PROMPT},
+            {"role": "user", "content": build_improvement_prompt(text, qcm)}
+        ],
+        temperature=0.7,
+        max_tokens=1000,
+        response_format={"type": "json_object"}
+    )
+
+    # Parse response
+    result = response.choices[0].message.content
+    improved_qcm = json.loads(result)
+
+    # Ensure the correct answer is in the choices
+    if improved_qcm["correct_answer"] not in improved_qcm["choices"]:
+        improved_qcm["choices"].append(improved_qcm["correct_answer"])
+
+    if result_cache is not None:
+        result_cache.put(cache_key, improved_qcm)
+    return improved_qcm
+
+
+def improve_qcms(gateway: LLMGateway, text: str, qcms: List[Dict[str, Any]],
+                 max_concurrency: int = IMPROVEMENT_MAX_CONCURRENCY,
+                 on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                 force_fresh: bool = False) -> List[Dict[str, Any]]:
+    """
+    Improve a list of QCMs with concurrent requests.
+
+    A question whose improvement fails is kept as it was, so one bad
+    response does not discard the others.
+
+    Args:
+        gateway: LLM gateway used for the requests
+        text: Source text of the questions
+        qcms: Questions to improve
+        max_concurrency: Maximum number of requests in flight
+        on_result: Called with (index, question) as each question is done
+        force_fresh: Skip the result cache lookup
+
+    Returns:
+        The improved questions, in the original order
+    """
+    if not qcms:
+        return []
+
+    def improve_or_keep(qcm):
+        try:
+            return improve_qcm(gateway, text, qcm, force_fresh)
+        except Exception as e:
+            print(f"Error improving QCM, keeping the original: {e}")
+            return qcm
+
+    improved = [None] * len(qcms)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(qcms)))) as executor:
+        futures = {executor.submit(improve_or_keep, qcm): i for i, qcm in enumerate(qcms)}
+        for future in as_completed(futures):
+            i = futures[future]
+            improved[i] = future.result()
+            if on_result:
+                on_result(i, improved[i])
+    return improved
+
+
+def improve_qcms_batched(gateway: LLMGateway, text: str, qcms: List[Dict[str, Any]],
+                         max_concurrency: int = IMPROVEMENT_MAX_CONCURRENCY,
+                         on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                         force_fresh: bool = False) -> List[Dict[str, Any]]:
+    """
+    Improve a list of QCMs with as few requests as the output cap allows.
+
+    The source text is sent once per request, each covering as many
+    questions as fit in IMPROVEMENT_MAX_OUTPUT_TOKENS. Questions missing
+    or malformed in the responses are improved with per-question requests.
+
+    Args:
+        gateway: LLM gateway used for the requests
+        text: Source text of the questions
+        qcms: Questions to improve
+        max_concurrency: Maximum number of fallback requests in flight
+        on_result: Called with (index, question) as each question is done
+        force_fresh: Skip the result cache lookup
+
+    Returns:
+        The improved questions, in the original order
+    """
+    if not qcms:
+        return []
+
+    result_cache = get_result_cache()
+    cache_key = make_key("batch_improvement", text, qcms=qcms, model=IMPROVEMENT_MODEL,
+                         prompt_version=IMPROVEMENT_PROMPT_VERSION)
+    if result_cache is not None and not force_fresh:
+        cached_qcms = result_cache.get(cache_key)
+        if cached_qcms is not None:
+            if on_result:
+                for index, qcm in enumerate(cached_qcms):
+                    on_result(index, qcm)
+            return cached_qcms
+
+    improved = [None] * len(qcms)
+    batch_size = max(1, IMPROVEMENT_MAX_OUTPUT_TOKENS // IMPROVEMENT_TOKENS_PER_QUESTION)
+    for offset in range(0, len(qcms), batch_size):
+        batch = qcms[offset:offset + batch_size]
+        try:
+            response = gateway.chat_completion(
+                priority=INTERACTIVE,
+                model=IMPROVEMENT_MODEL,
+                messages=[
+                    {"role": "system", "content": IMPROVEMENT_SYSTEM_PROMPT},
+                    {"role": "user", "content": build_batch_improvement_prompt(text, batch)}
+                ],
+                temperature=0.7,
+                max_tokens=IMPROVEMENT_TOKENS_PER_QUESTION * len(batch),
+                response_format={"type": "json_object"}
+            )
+            result = json.loads(response.choices[0].message.content)
+            items = result.get("questions", []) if isinstance(result, dict) else result
+            if len(items) != len(batch):
+                print(f"Batch improvement returned {len(items)} questions for {len(batch)}")
+
+            for position, item in enumerate(items):
+                if not isinstance(item, dict):
+                    continue
+                # Indexes in the response are relative to the batch
+                index = item.get("index", position)
+                if not isinstance(index, int) or not 0 <= index < len(batch) or improved[offset + index] is not None:
+                    continue
+                if not all(key in item for key in ("question", "correct_answer", "choices")):
+                    continue
+                improved_qcm = {key: item[key] for key in ("question", "correct_answer", "choices")}
+                # Ensure the correct answer is in the choices
+                if improved_qcm["correct_answer"] not in improved_qcm["choices"]:
+                    improved_qcm["choices"].append(improved_qcm["correct_answer"])
+                improved[offset + index] = improved_qcm
+                if on_result:
+                    on_result(offset + index, improved_qcm)
+        except Exception as e:
+            print(f"Error improving QCMs in batch: {e}")
+
+    # Fall back to per-question requests for anything the batch did not cover
+    missing = [i for i, qcm in enumerate(improved) if qcm is None]
+    if missing:
+        print(f"Improving {len(missing)} questions individually")
+        fallback_result = (lambda j, qcm: on_result(missing[j], qcm)) if on_result else None
+        fallback = improve_qcms(gateway, text, [qcms[i] for i in missing], max_concurrency, fallback_result, force_fresh)
+        for i, qcm in zip(missing, fallback):
+            improved[i] = qcm
+    elif result_cache is not None:
+        result_cache.put(cache_key, improved)
+
+    return improved
+
+
+def improve_qcm_set(gateway: LLMGateway, text: str, qcms: List[Dict[str, Any]], mode: str = None,
+                    on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                    force_fresh: bool = False) -> List[Dict[str, Any]]:
+    """Improve a list of QCMs using the given improvement mode (defaults to IMPROVEMENT_MODE)."""
+    mode = mode or IMPROVEMENT_MODE
+    if mode not in IMPROVEMENT_MODES:
+        raise ValueError(f"Unknown improvement mode: {mode}")
+    if mode == "batch":
+        return improve_qcms_batched(gateway, text, qcms, on_result=on_result, force_fresh=force_fresh)
+    return improve_qcms(gateway, text, qcms, on_result=on_result, force_fresh=force_fresh)
@@ -0,0 +1,261 @@
+"""
+Registry of per-document FAISS indexes persisted on disk.
+"""
+import os
+import json
+import time
+import shutil
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import faiss
+from vector_index import configure_search, optimize_index, prepare_vectors, search_index
+
+DEFAULT_INDEX_ROOT = os.getenv("INDEX_ROOT", "indexes")
+DEFAULT_MAX_LOADED = int(os.getenv("INDEX_MAX_LOADED", "8"))
+
+
+class DocumentIndex:
+    """A FAISS index together with the chunks it was built from."""
+
+    def __init__(self, name: str, index, chunks: List[str], complete: bool = True,
+                 pages: Optional[List[int]] = None):
+        self.name = name
+        self.index = index
+        self.chunks = chunks
+        # Page number where each chunk starts, when known
+        self.pages = pages
+        # False while the document is still being ingested
+        self.complete = complete
+        self._lock = threading.Lock()
+
+    def add(self, embeddings, chunks: List[str], pages: Optional[List[int]] = None) -> None:
+        """Append embedded chunks (and their page numbers) to the index."""
+        with self._lock:
+            self.index.add(prepare_vectors(embeddings, self.index))
+            self.chunks.extend(chunks)
+            if self.pages is not None and pages is not None:
+                self.pages.extend(pages)
+
+    def search(self, query_embeddings, top_k: int):
+        """Search the index, safely while chunks are still being added."""
+        with self._lock:
+            k = min(top_k, len(self.chunks))
+            return search_index(self.index, query_embeddings, k)
+
+    def optimize(self) -> None:
+        """Rebuild the flat index filled during ingestion as the type suited to its size."""
+        with self._lock:
+            self.index = optimize_index(self.index)
+
+
+class IndexRegistry:
+    def __init__(self, root: str = DEFAULT_INDEX_ROOT, max_loaded: int = DEFAULT_MAX_LOADED):
+        """
+        Initialize the index registry.
+
+        Each document gets its own directory under root holding the FAISS
+        index, its chunks and some metadata. Indexes are read from disk on
+        first use and at most max_loaded of them are kept in memory, the
+        least recently used being dropped first.
+
+        Args:
+            root: Directory where the indexes are stored
+            max_loaded: Maximum number of indexes kept in memory
+        """
+        self.root = root
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def document_key(document_path: str) -> str:
+        """Return the registry key of a document (its file name)."""
+        return os.path.basename(document_path)
+
+    def _document_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    @staticmethod
+    def _write_json(path: str, data) -> None:
+        """Write a JSON file through a temporary file, so it is replaced atomically."""
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def _version_dir(self, key: str, meta: dict) -> str:
+        """Directory holding the files of the version a meta points to (the document directory before versions)."""
+        directory = self._document_dir(key)
+        version = meta.get("version")
+        return os.path.join(directory, version) if version else directory
+
+    def _read_meta(self, key: str) -> Optional[dict]:
+        meta_path = os.path.join(self._document_dir(key), "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def has(self, document_path: str) -> bool:
+        """Check whether an index exists for a document."""
+        return self._read_meta(self.document_key(document_path)) is not None
+
+    def is_current(self, document_path: str, content_hash: str, embedding_model: str = None) -> bool:
+        """Check whether the stored index was built from the given file content (and embedding model)."""
+        meta = self._read_meta(self.document_key(document_path))
+        if meta is None or meta.get("content_hash") != content_hash:
+            return False
+        return embedding_model is None or meta.get("embedding_model") == embedding_model
+
+    def register(self, document_path: str, index, chunks: List[str], content_hash: str = None,
+                 pages: Optional[List[int]] = None, embedding_model: str = None) -> DocumentIndex:
+        """
+        Store the index of a document on disk and make it available.
+
+        Args:
+            document_path: Path or name of the document
+            index: FAISS index built from the chunks
+            chunks: Text chunks of the document
+            content_hash: Optional hash of the source file
+            pages: Optional page number where each chunk starts
+            embedding_model: Optional name of the model that embedded the chunks
+
+        Returns:
+            The registered DocumentIndex
+        """
+        key = self.document_key(document_path)
+        directory = self._document_dir(key)
+
+        # Each registration writes a new version directory; meta.json is
+        # replaced last to point at it, so readers see either the old or
+        # the new index, chunks and pages, never a mix
+        version = f"v{time.time_ns()}"
+        version_dir = os.path.join(directory, version)
+        os.makedirs(version_dir)
+        faiss.write_index(index, os.path.join(version_dir, "index.faiss"))
+        self._write_json(os.path.join(version_dir, "chunks.json"), chunks)
+        if pages is not None:
+            self._write_json(os.path.join(version_dir, "pages.json"), pages)
+
+        meta = {
+            "name": key,
+            "version": version,
+            "num_chunks": len(chunks),
+            "index_type": type(index).__name__,
+            "content_hash": content_hash,
+            "embedding_model": embedding_model,
+            "updated_at": time.time()
+        }
+        document = DocumentIndex(key, index, chunks, pages=pages)
+        with self._lock:
+            previous = self._read_meta(key)
+            self._write_json(os.path.join(directory, "meta.json"), meta)
+            self._remember(key, document)
+            self._remove_old_versions(key, keep={version, previous.get("version") if previous else None})
+        print(f"Registered index for {key} ({len(chunks)} chunks)")
+        return document
+
+    def _remove_old_versions(self, key: str, keep: set) -> None:
+        """
+        Delete superseded versions of a document.
+
+        The previous version is kept, in case another process is still
+        loading it. Files of the unversioned layout are kept likewise
+        until the version replacing them is itself superseded.
+        """
+        directory = self._document_dir(key)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith("v") and name not in keep and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif None not in keep and name in ("index.faiss", "chunks.json", "pages.json"):
+                os.remove(path)
+
+    def publish(self, document: DocumentIndex) -> None:
+        """Make a document being ingested searchable before it is persisted."""
+        with self._lock:
+            self._remember(document.name, document)
+
+    def get(self, document_path: str) -> Optional[DocumentIndex]:
+        """
+        Get the index of a document, loading it from disk if needed.
+
+        Args:
+            document_path: Path or name of the document
+
+        Returns:
+            The DocumentIndex, or None if the document was never indexed
+        """
+        key = self.document_key(document_path)
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+
+            for attempt in range(3):
+                meta = self._read_meta(key)
+                if meta is None:
+                    return None
+                try:
+                    index, chunks, pages = self._load_version(self._version_dir(key, meta))
+                    break
+                except (OSError, RuntimeError):
+                    # Another process replaced the version while it was being read
+                    if attempt == 2 or self._read_meta(key) == meta:
+                        raise
+
+            document = DocumentIndex(key, index, chunks, pages=pages)
+            self._remember(key, document)
+            print(f"Loaded index for {key} ({len(chunks)} chunks)")
+            return document
+
+    @staticmethod
+    def _load_version(directory: str):
+        """Read the index, chunks and pages of a version."""
+        index = configure_search(faiss.read_index(os.path.join(directory, "index.faiss")))
+        with open(os.path.join(directory, "chunks.json"), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        pages = None
+        pages_path = os.path.join(directory, "pages.json")
+        if os.path.exists(pages_path):
+            with open(pages_path, "r", encoding="utf-8") as f:
+                pages = json.load(f)
+        return index, chunks, pages
+
+    def discard(self, document_path: str) -> None:
+        """Withdraw a document published while ingested, if its ingestion failed."""
+        key = self.document_key(document_path)
+        with self._lock:
+            document = self._loaded.get(key)
+            if document is not None and not document.complete:
+                del self._loaded[key]
+                print(f"Discarded partial index for {key}")
+
+    def _remember(self, key: str, document: DocumentIndex) -> None:
+        """Keep a document in memory and evict the coldest ones over the limit."""
+        self._loaded[key] = document
+        self._loaded.move_to_end(key)
+        # Documents still being ingested only live in memory, never evict them
+        cold = [name for name, doc in self._loaded.items() if doc.complete]
+        while len(self._loaded) > self.max_loaded and cold:
+            evicted = cold.pop(0)
+            del self._loaded[evicted]
+            print(f"Evicted index for {evicted} from memory")
+
+    def list_documents(self) -> List[dict]:
+        """List the metadata of all indexed documents, most recent first."""
+        documents = []
+        for key in os.listdir(self.root):
+            meta = self._read_meta(key)
+            if meta is not None:
+                documents.append(meta)
+        documents.sort(key=lambda meta: meta.get("updated_at", 0), reverse=True)
+        return documents
+
+    def latest(self) -> Optional[DocumentIndex]:
+        """Get the most recently indexed document, if any."""
+        documents = self.list_documents()
+        if not documents:
+            return None
+        return self.get(documents[0]["name"])
@@ -0,0 +1,195 @@
+"""
+Bounded job queue with a worker pool for long-running tasks.
+"""
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+FINISHED_STATUSES = ("completed", "error")
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is full."""
+
+
+class JobQueue:
+    def __init__(self, name: str, num_workers: int = 2, max_queue_size: int = 20, result_ttl: float = 600):
+        """
+        Initialize the job queue.
+
+        Jobs wait in a bounded FIFO queue and are run by a fixed pool of
+        worker threads. Each job has a status record that the job function
+        can update while it runs, and an ordered list of events that
+        streaming clients can follow. Records of finished jobs are dropped
+        result_ttl seconds after they finish.
+
+        Args:
+            name: Name of the queue, used in logs and thread names
+            num_workers: Number of worker threads
+            max_queue_size: Maximum number of jobs waiting to run
+            result_ttl: Seconds a finished job's record is kept
+        """
+        self.name = name
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.result_ttl = result_ttl
+
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, List[Dict[str, Any]]] = {}
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._workers = []
+        self._running = False
+
+    def start(self) -> None:
+        """Start the worker threads if they are not running yet."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._work, name=f"{self.name}-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        print(f"Started {self.num_workers} {self.name} workers")
+
+    def shutdown(self) -> None:
+        """Stop the workers once they finish their current job."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._workers = []
+
+    def submit(self, job_id: str, fn: Callable, *args, fields: Optional[Dict[str, Any]] = None, **kwargs) -> None:
+        """
+        Queue a job.
+
+        Args:
+            job_id: Unique ID of the job
+            fn: Function to run, called as fn(*args, **kwargs)
+            fields: Initial fields of the status record, set before any worker can update it
+
+        Raises:
+            JobQueueFull: If max_queue_size jobs are already waiting
+        """
+        self.start()
+        with self._condition:
+            self._evict_expired()
+            if len(self._pending) >= self.max_queue_size:
+                raise JobQueueFull(f"{self.name} queue is full ({self.max_queue_size} jobs waiting)")
+            self._records[job_id] = {**(fields or {}), "status": "queued", "timestamp": time.time()}
+            self._events[job_id] = [{"event": "status", "status": "queued"}]
+            self._pending.append((job_id, fn, args, kwargs))
+            self._condition.notify()
+
+    def update(self, job_id: str, **fields) -> None:
+        """Update the status record of a job, publishing a status event when it changes."""
+        with self._condition:
+            record = self._records.setdefault(job_id, {})
+            previous_status = record.get("status")
+            record.update(fields)
+            record["timestamp"] = time.time()
+            if record.get("status") != previous_status:
+                event = {"event": "status", "status": record["status"]}
+                if "error" in fields:
+                    event["error"] = fields["error"]
+                self._events.setdefault(job_id, []).append(event)
+
+    def publish(self, job_id: str, event: str, **data) -> None:
+        """Append an event to the event list of a job."""
+        with self._condition:
+            self._events.setdefault(job_id, []).append({"event": event, **data})
+
+    def events_since(self, job_id: str, cursor: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Get the events of a job published after the first cursor ones.
+
+        Returns:
+            The new events, and whether the job has finished
+        """
+        with self._condition:
+            events = self._events.get(job_id, [])[cursor:]
+            record = self._records.get(job_id)
+            finished = record is None or record.get("status") in FINISHED_STATUSES
+            return events, finished
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a copy of the status record of a job.
+
+        Queued jobs also report their position in the queue (1 is next)
+        and the current queue depth.
+        """
+        with self._condition:
+            self._evict_expired()
+            record = self._records.get(job_id)
+            if record is None:
+                return None
+            record = dict(record)
+            if record.get("status") == "queued":
+                for position, (pending_id, _, _, _) in enumerate(self._pending, start=1):
+                    if pending_id == job_id:
+                        record["queue_position"] = position
+                        break
+            record["queue_depth"] = len(self._pending)
+            return record
+
+    def queue_depth(self) -> int:
+        """Return the number of jobs waiting to run."""
+        with self._condition:
+            return len(self._pending)
+
+    def _evict_expired(self) -> None:
+        """Drop the records of jobs that finished more than result_ttl seconds ago."""
+        now = time.time()
+        expired = [
+            job_id for job_id, record in self._records.items()
+            if record.get("status") in FINISHED_STATUSES and now - record.get("timestamp", now) > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._records[job_id]
+            self._events.pop(job_id, None)
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait(timeout=self.result_ttl)
+                    self._evict_expired()
+                if not self._running:
+                    return
+                job_id, fn, args, kwargs = self._pending.popleft()
+            self.update(job_id, status="processing")
+
+            try:
+                fn(*args, **kwargs)
+                record = self.get(job_id)
+                if record is not None and record.get("status") not in FINISHED_STATUSES:
+                    self.update(job_id, status="completed")
+            except Exception as e:
+                print(f"Error in {self.name} job {job_id}: {e}")
+                self.update(job_id, status="error", error=str(e))
+
+
+def generation_queue_from_env() -> JobQueue:
+    """Create the QCM generation queue configured from environment variables."""
+    return JobQueue(
+        "generation",
+        num_workers=int(os.getenv("GENERATION_WORKERS", "2")),
+        max_queue_size=int(os.getenv("GENERATION_QUEUE_SIZE", "20")),
+        result_ttl=float(os.getenv("TASK_RESULT_TTL", "600"))
+    )
+
+
+def ingestion_queue_from_env() -> JobQueue:
+    """Create the PDF ingestion queue configured from environment variables."""
+    return JobQueue(
+        "ingestion",
+        num_workers=int(os.getenv("INGESTION_WORKERS", "1")),
+        max_queue_size=int(os.getenv("INGESTION_QUEUE_SIZE", "10")),
+        result_ttl=float(os.getenv("TASK_RESULT_TTL", "600"))
+    )
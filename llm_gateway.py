@@ -0,0 +1,291 @@
+"""
+Process-wide gateway for OpenAI calls with rate limiting and retries.
+"""
+import os
+import time
+import random
+import threading
+from typing import Any, Dict, List, Optional
+import httpx
+from openai import OpenAI, APIConnectionError, APIStatusError, APITimeoutError
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "200000"))
+DEFAULT_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+DEFAULT_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "1.0"))
+DEFAULT_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "60"))
+
+# HTTP connection pool shared by all OpenAI traffic
+POOL_MAX_CONNECTIONS = int(os.getenv("OPENAI_POOL_MAX_CONNECTIONS", "20"))
+POOL_MAX_KEEPALIVE = int(os.getenv("OPENAI_POOL_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_POOL_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+CHAT_TIMEOUT = float(os.getenv("OPENAI_CHAT_TIMEOUT", "60"))
+EMBEDDING_TIMEOUT = float(os.getenv("OPENAI_EMBEDDING_TIMEOUT", "30"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens of a text (Arabic runs about 3 characters per token)."""
+    return len(text) // 3 + 1
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        """
+        Initialize a token bucket refilled continuously at per_minute per minute.
+
+        Args:
+            per_minute: Capacity of the bucket and refill amount per minute
+        """
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Return how long to wait before amount tokens are available."""
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class MeteredTransport(httpx.HTTPTransport):
+    """HTTP transport that records pool-level metrics for every request."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._metrics = {"requests": 0, "in_flight": 0, "errors": 0, "total_latency": 0.0}
+        self._status_classes: Dict[str, int] = {}
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.monotonic()
+        with self._lock:
+            self._metrics["requests"] += 1
+            self._metrics["in_flight"] += 1
+        try:
+            response = super().handle_request(request)
+            status_class = f"{response.status_code // 100}xx"
+            with self._lock:
+                self._status_classes[status_class] = self._status_classes.get(status_class, 0) + 1
+            return response
+        except Exception:
+            with self._lock:
+                self._metrics["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._metrics["in_flight"] -= 1
+                self._metrics["total_latency"] += time.monotonic() - start
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request counters, latency and connection counts of the pool."""
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["responses"] = dict(self._status_classes)
+        completed = stats["requests"] - stats["in_flight"]
+        stats["avg_latency"] = stats.pop("total_latency") / completed if completed else 0.0
+        connections = list(self._pool.connections)
+        stats["connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for connection in connections if connection.is_idle())
+        stats["max_connections"] = POOL_MAX_CONNECTIONS
+        stats["max_keepalive_connections"] = POOL_MAX_KEEPALIVE
+        return stats
+
+
+def create_pool_transport() -> MeteredTransport:
+    """Create the metered keep-alive transport used for OpenAI traffic."""
+    return MeteredTransport(
+        limits=httpx.Limits(
+            max_connections=POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=POOL_MAX_KEEPALIVE,
+            keepalive_expiry=POOL_KEEPALIVE_EXPIRY
+        )
+    )
+
+
+def create_http_client(transport: MeteredTransport = None) -> httpx.Client:
+    """Create the HTTP client used for OpenAI traffic on the given (or a new) pool transport."""
+    if transport is None:
+        transport = create_pool_transport()
+    return httpx.Client(transport=transport, timeout=httpx.Timeout(CHAT_TIMEOUT, connect=CONNECT_TIMEOUT))
+
+
+class LLMGateway:
+    def __init__(self, client: OpenAI = None, requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_max: float = DEFAULT_BACKOFF_MAX,
+                 api_key: str = None):
+        """
+        Initialize the LLM gateway.
+
+        Every call first takes one request and its estimated tokens from
+        the per-minute buckets. Interactive calls waiting for capacity go
+        before bulk ones. Rate limit, server and connection errors are
+        retried with jittered exponential backoff, honoring Retry-After.
+
+        Args:
+            client: OpenAI client (created from OPENAI_API_KEY on the
+                shared connection pool if None)
+            requests_per_minute: Request budget per minute
+            tokens_per_minute: Token budget per minute
+            max_retries: Maximum number of retries of a call
+            backoff_base: First backoff delay in seconds
+            backoff_max: Maximum backoff delay in seconds
+            api_key: API key of the client created when client is None
+                (defaults to OPENAI_API_KEY)
+        """
+        self._http_client = None
+        self._transport = None
+        if client is None:
+            api_key = api_key or os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OpenAI API key not found in environment variables")
+            # Retries are handled here, not by the client
+            self._transport = create_pool_transport()
+            self._http_client = create_http_client(self._transport)
+            client = OpenAI(api_key=api_key, max_retries=0, http_client=self._http_client)
+
+        self.client = client
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._condition = threading.Condition()
+        self._waiting_interactive = 0
+
+    def _acquire(self, tokens: int, priority: str) -> None:
+        """Block until the buckets can serve one request of the given size."""
+        with self._condition:
+            if priority == INTERACTIVE:
+                self._waiting_interactive += 1
+            try:
+                while True:
+                    # Bulk calls yield to any interactive call that is waiting
+                    if priority != INTERACTIVE and self._waiting_interactive > 0:
+                        self._condition.wait(timeout=1)
+                        continue
+                    wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                    if wait <= 0:
+                        self._requests.take(1)
+                        self._tokens.take(tokens)
+                        return
+                    self._condition.wait(timeout=wait)
+            finally:
+                if priority == INTERACTIVE:
+                    self._waiting_interactive -= 1
+                    self._condition.notify_all()
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Return how long to wait before retrying after error, or None if it should not be retried."""
+        if isinstance(error, APIStatusError):
+            if error.status_code != 429 and error.status_code < 500:
+                return None
+            retry_after = error.response.headers.get("retry-after") if error.response is not None else None
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        elif not isinstance(error, (APIConnectionError, APITimeoutError)):
+            return None
+
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, delay)
+
+    def _call(self, fn, tokens: int, priority: str, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self._acquire(tokens, priority)
+            try:
+                return fn(**kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt == self.max_retries:
+                    raise
+                print(f"OpenAI call failed ({e}), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+
+    def chat_completion(self, priority: str = INTERACTIVE, **kwargs):
+        """
+        Create a chat completion through the gateway.
+
+        Args:
+            priority: INTERACTIVE or BULK
+            **kwargs: Arguments of client.chat.completions.create
+
+        Returns:
+            The chat completion response
+        """
+        kwargs.setdefault("timeout", CHAT_TIMEOUT)
+        prompt = "".join(str(message.get("content", "")) for message in kwargs.get("messages", []))
+        tokens = estimate_tokens(prompt) + kwargs.get("max_tokens", 0)
+        return self._call(self.client.chat.completions.create, tokens, priority, **kwargs)
+
+    def embedding(self, input, priority: str = INTERACTIVE, **kwargs):
+        """
+        Create embeddings through the gateway.
+
+        Args:
+            input: Text or list of texts to embed
+            priority: INTERACTIVE or BULK
+            **kwargs: Other arguments of client.embeddings.create
+
+        Returns:
+            The embeddings response
+        """
+        kwargs.setdefault("timeout", EMBEDDING_TIMEOUT)
+        texts: List[str] = input if isinstance(input, list) else [input]
+        tokens = sum(estimate_tokens(text) for text in texts)
+        return self._call(self.client.embeddings.create, tokens, priority, input=input, **kwargs)
+
+    def pool_stats(self) -> Optional[Dict[str, Any]]:
+        """Return the metrics of the connection pool, if the gateway owns one."""
+        if self._transport is None:
+            return None
+        return self._transport.stats()
+
+    def close(self) -> None:
+        """Close the connection pool owned by the gateway."""
+        if self._http_client is not None:
+            self._http_client.close()
+
+
+_default_gateway = None
+_default_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Return the process-wide LLM gateway, creating it on first use."""
+    global _default_gateway
+    with _default_gateway_lock:
+        if _default_gateway is None:
+            _default_gateway = LLMGateway()
+        return _default_gateway
+
+
+def close_gateway() -> None:
+    """Close the process-wide LLM gateway and its connection pool."""
+    global _default_gateway
+    with _default_gateway_lock:
+        if _default_gateway is not None:
+            _default_gateway.close()
+            _default_gateway = None
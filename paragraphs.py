@@ -0,0 +1,103 @@
+"""
+Paragraph splitting of pasted texts, shared by the paragraph picker and generation.
+"""
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterator, List, Tuple
+
+PARAGRAPH_CACHE_SIZE = int(os.getenv("PARAGRAPH_CACHE_SIZE", "64"))
+# Texts longer than this many characters get their paragraphs streamed back
+PARAGRAPH_STREAM_THRESHOLD = int(os.getenv("PARAGRAPH_STREAM_THRESHOLD", "200000"))
+
+# A paragraph runs up to and including the next Arabic or Latin delimiter
+PARAGRAPH_PATTERN = re.compile(r'[^.،؟!]*[.،؟!]|[^.،؟!]+')
+
+
+def iter_paragraph_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """
+    Iterate over the paragraphs of a text as offsets.
+
+    Paragraphs end at ".", "،", "؟" or "!", and their surrounding
+    whitespace is left out of the span. Empty paragraphs are skipped.
+
+    Args:
+        text: Text to split
+
+    Returns:
+        Iterator of (start, end) offsets into text
+    """
+    for match in PARAGRAPH_PATTERN.finditer(text):
+        start, end = match.span()
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            yield start, end
+
+
+class ParagraphCache:
+    def __init__(self, max_entries: int = PARAGRAPH_CACHE_SIZE):
+        """
+        Initialize the paragraph cache.
+
+        Keeps the paragraph offsets of the max_entries most recently used
+        texts, keyed by the SHA-256 of the text, so the indexes chosen in
+        the paragraph picker are resolved without splitting the text again.
+
+        Args:
+            max_entries: Maximum number of texts kept
+        """
+        self.max_entries = max_entries
+        self._spans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def spans(self, text: str) -> List[Tuple[int, int]]:
+        """Return the paragraph offsets of a text, splitting it on a cache miss."""
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            spans = self._spans.get(key)
+            if spans is not None:
+                self._spans.move_to_end(key)
+                return spans
+
+        spans = list(iter_paragraph_spans(text))
+        with self._lock:
+            self._spans[key] = spans
+            self._spans.move_to_end(key)
+            while len(self._spans) > self.max_entries:
+                self._spans.popitem(last=False)
+        return spans
+
+    def select(self, text: str, indexes: List[int]) -> str:
+        """
+        Join the paragraphs of a text at the given indexes.
+
+        Out-of-range indexes are ignored. If none is valid, the first
+        paragraph is used, or the whole text if it has no paragraphs.
+
+        Args:
+            text: Source text
+            indexes: Indexes of the paragraphs to keep
+
+        Returns:
+            The selected paragraphs separated by spaces
+        """
+        spans = self.spans(text)
+        selected = [text[spans[i][0]:spans[i][1]] for i in indexes if 0 <= i < len(spans)]
+        if selected:
+            return " ".join(selected)
+        if spans:
+            return text[spans[0][0]:spans[0][1]]
+        return text
+
+
+_default_cache = ParagraphCache()
+
+
+def get_paragraph_cache() -> ParagraphCache:
+    """Return the process-wide paragraph cache."""
+    return _default_cache
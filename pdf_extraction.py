@@ -0,0 +1,127 @@
+"""
+Text extraction from PDF files, serial or in a pool of worker processes.
+
+This module stays light (PyPDF2 and the standard library only), since
+every spawned worker process imports it.
+"""
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Tuple
+from PyPDF2 import PdfReader
+
+# PDF extraction settings (1 worker means serial extraction)
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+# Reader of the PDF a worker process last extracted from, keyed by (path, mtime, size)
+_worker_reader = None
+_worker_reader_key = None
+
+
+def _get_worker_reader(pdf_path: str) -> PdfReader:
+    """Return a reader of the PDF, parsing it only once per worker process."""
+    global _worker_reader, _worker_reader_key
+    stat = os.stat(pdf_path)
+    key = (pdf_path, stat.st_mtime_ns, stat.st_size)
+    if key != _worker_reader_key:
+        _worker_reader, _worker_reader_key = PdfReader(pdf_path), key
+    return _worker_reader
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract the text of pages [start, end) of a PDF in a worker process."""
+    reader = _get_worker_reader(pdf_path)
+    pages = []
+    for page_index in range(start, end):
+        page_text = reader.pages[page_index].extract_text()
+        if page_text:
+            pages.append((page_index + 1, page_text))
+    return pages
+
+
+# Extraction pools by number of workers, created on first use and reused across uploads
+_extraction_pools: Dict[int, ProcessPoolExecutor] = {}
+_extraction_pools_lock = threading.Lock()
+
+
+def get_extraction_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Get the process pool extracting PDF pages with the given number of workers.
+
+    Workers are spawned rather than forked: the server is multithreaded
+    (job workers, HTTP pool, faiss threads), and a forked child could
+    inherit locks held by those threads and deadlock.
+    """
+    with _extraction_pools_lock:
+        pool = _extraction_pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _extraction_pools[workers] = pool
+        return pool
+
+
+def _drop_extraction_pool(workers: int, pool: ProcessPoolExecutor) -> None:
+    """Forget a broken pool, so the next extraction starts a new one."""
+    with _extraction_pools_lock:
+        if _extraction_pools.get(workers) is pool:
+            del _extraction_pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_extraction_pools() -> None:
+    """Stop the extraction worker processes."""
+    with _extraction_pools_lock:
+        pools = list(_extraction_pools.values())
+        _extraction_pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_numbered_pages(pdf_path: str, workers: int = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page number, text) for each non-empty page of a PDF, in order.
+
+    Serially, pages are extracted one at a time as they are consumed.
+    With more than one worker, page ranges are extracted in a shared
+    process pool; a few ranges are kept in flight ahead of the consumer.
+    Extraction errors propagate, so a corrupt PDF is never indexed as
+    empty or partial.
+
+    Args:
+        pdf_path: Path to the PDF file
+        workers: Number of extraction processes (defaults to PDF_EXTRACTION_WORKERS)
+    """
+    workers = PDF_EXTRACTION_WORKERS if workers is None else workers
+    reader = PdfReader(pdf_path)
+    num_pages = len(reader.pages)
+
+    if workers <= 1 or num_pages <= PDF_PAGES_PER_TASK:
+        for page_index, page in enumerate(reader.pages):
+            page_text = page.extract_text()
+            if page_text:
+                yield page_index + 1, page_text
+        return
+
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, num_pages))
+              for start in range(0, num_pages, PDF_PAGES_PER_TASK)]
+    executor = get_extraction_pool(workers)
+    pending = deque()
+    try:
+        for start, end in ranges:
+            pending.append(executor.submit(extract_page_range, pdf_path, start, end))
+            # Keep ranges in order and bound the text held in memory
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    except BrokenProcessPool:
+        _drop_extraction_pool(workers, executor)
+        raise
+    finally:
+        # Ranges of an abandoned or failed extraction are not worth finishing
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,478 @@
+"""
+Append-only archive of saved QCM sets, replacing one JSON file per text.
+
+Texts are appended to compressed JSONL segments, and an offset index maps
+each text ID to its record, so a text is read back with a single seek.
+
+Usage:
+    python qcm_archive.py stats
+    python qcm_archive.py migrate Saved_qcms
+    python qcm_archive.py export 12 25
+    python qcm_archive.py compact
+"""
+import os
+import json
+import gzip
+import zlib
+import struct
+import argparse
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+ARCHIVE_DIR = os.getenv("QCM_ARCHIVE_DIR", "Saved_qcms/archive")
+# A new segment is started once the current one reaches this size
+ARCHIVE_SEGMENT_SIZE = int(os.getenv("QCM_ARCHIVE_SEGMENT_MB", "64")) * 1024 * 1024
+# Flush appends to disk before returning (slower, survives power loss)
+ARCHIVE_FSYNC = os.getenv("QCM_ARCHIVE_FSYNC", "false").lower() in ("1", "true", "yes")
+
+SEGMENT_PREFIX = "segment_"
+SEGMENT_SUFFIX = ".jsonl.gz"
+INDEX_NAME = "index.bin"
+LOCK_NAME = "archive.lock"
+# Index entry: text ID, segment number, offset and length of the record
+INDEX_ENTRY = struct.Struct("<qIQI")
+# Compressed bytes fed to the decompressor at a time when scanning a segment
+SCAN_CHUNK_SIZE = 4096
+
+
+def encode_record(text_doc: Dict[str, Any]) -> bytes:
+    """
+    Encode a text document as one JSON line in its own gzip member.
+
+    Concatenated members form a valid gzip file, so segments can still be
+    read with zcat, while each record can be decompressed on its own.
+    """
+    line = json.dumps(text_doc, ensure_ascii=False, separators=(",", ":")) + "\n"
+    return gzip.compress(line.encode("utf-8"), mtime=0)
+
+
+def decode_record(data: bytes) -> Dict[str, Any]:
+    """Decode a record written by encode_record."""
+    return json.loads(gzip.decompress(data))
+
+
+def iter_segment_records(path: str, start: int = 0) -> Iterator[Tuple[int, int, Dict[str, Any]]]:
+    """
+    Iterate over the records of a segment from an offset.
+
+    Stops at the first incomplete or corrupt record, such as one cut
+    short by a crash.
+
+    Returns:
+        Iterator of (offset, length, text document)
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = memoryview(f.read())
+    position = 0
+    while position < len(data):
+        # Feed small slices of the segment, so each record only costs its own size
+        decompressor = zlib.decompressobj(wbits=31)
+        parts = []
+        end = position
+        try:
+            while not decompressor.eof and end < len(data):
+                piece = data[end:end + SCAN_CHUNK_SIZE]
+                parts.append(decompressor.decompress(piece))
+                end += len(piece)
+            if not decompressor.eof:
+                return
+            text_doc = json.loads(b"".join(parts))
+        except (zlib.error, ValueError):
+            return
+        length = end - len(decompressor.unused_data) - position
+        yield start + position, length, text_doc
+        position += length
+
+
+class QCMArchive:
+    def __init__(self, directory: str = ARCHIVE_DIR, segment_size: int = ARCHIVE_SEGMENT_SIZE):
+        """
+        Initialize the archive.
+
+        Records and index entries are only ever appended. Saving a text
+        again appends a new record that supersedes the old one, whose
+        space is reclaimed by compact(). Appends and compaction take a
+        file lock, so several worker processes can share an archive; each
+        of them picks up the others' entries from the index on lookup.
+
+        Args:
+            directory: Directory holding the segments and the index
+            segment_size: Size in bytes from which a new segment is started
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, INDEX_NAME)
+
+        self._lock = threading.RLock()
+        self._entries: Dict[int, Tuple[int, int, int]] = {}
+        self._index_inode = None
+        self._index_size = 0
+        with self._lock:
+            self._refresh()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment:06d}{SEGMENT_SUFFIX}")
+
+    def _segments(self) -> List[int]:
+        """Return the numbers of the segment files, in order."""
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                segments.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        return sorted(segments)
+
+    def _refresh(self) -> None:
+        """Read the index entries appended since the last call, or the whole index if it was replaced."""
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            self._entries, self._index_inode, self._index_size = {}, None, 0
+            return
+        if stat.st_ino != self._index_inode or stat.st_size < self._index_size:
+            self._entries, self._index_inode, self._index_size = {}, stat.st_ino, 0
+        # A partial entry left by a crash is ignored until it is overwritten
+        end = stat.st_size - stat.st_size % INDEX_ENTRY.size
+        if end <= self._index_size:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_size)
+            data = f.read(end - self._index_size)
+        for text_id, segment, offset, length in INDEX_ENTRY.iter_unpack(data):
+            self._entries[text_id] = (segment, offset, length)
+        self._index_size = end
+
+    def _lock_file(self):
+        """Open and lock the archive lock file, shared by the processes using the archive."""
+        lock_file = open(os.path.join(self.directory, LOCK_NAME), "a")
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _write_index(self, entries: List[Tuple[int, int, int, int]]) -> None:
+        with open(self.index_path, "ab") as f:
+            # Drop a partial entry left by a crash, so the new ones stay aligned
+            size = f.seek(0, os.SEEK_END)
+            if size % INDEX_ENTRY.size:
+                f.truncate(size - size % INDEX_ENTRY.size)
+            f.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+            f.flush()
+            if ARCHIVE_FSYNC:
+                os.fsync(f.fileno())
+
+    def _recover(self, segment: int) -> None:
+        """Index the records of a segment written before a crash prevented indexing them."""
+        path = self._segment_path(segment)
+        if not os.path.exists(path):
+            return
+        indexed_end = max((offset + length for seg, offset, length in self._entries.values() if seg == segment),
+                          default=0)
+        size = os.path.getsize(path)
+        if size <= indexed_end:
+            return
+        recovered = [(text_doc["_id"], segment, offset, length)
+                     for offset, length, text_doc in iter_segment_records(path, indexed_end)]
+        end = recovered[-1][2] + recovered[-1][3] if recovered else indexed_end
+        if end < size:
+            # Cut off the incomplete record
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        if recovered:
+            print(f"Recovered {len(recovered)} unindexed QCM sets in {os.path.basename(path)}")
+            self._write_index(recovered)
+            self._refresh()
+
+    def append_many(self, text_docs: List[Dict[str, Any]]) -> None:
+        """
+        Append text documents, as stored in MongoDB, to the archive.
+
+        Args:
+            text_docs: Documents with an integer _id
+        """
+        if not text_docs:
+            return
+        records = [(int(text_doc["_id"]), encode_record(text_doc)) for text_doc in text_docs]
+        with self._lock:
+            lock_file = self._lock_file()
+            try:
+                self._refresh()
+                segments = self._segments()
+                segment = segments[-1] if segments else 1
+                self._recover(segment)
+
+                entries = []
+                path = self._segment_path(segment)
+                f = open(path, "ab")
+                try:
+                    offset = f.seek(0, os.SEEK_END)
+                    for text_id, record in records:
+                        if offset >= self.segment_size:
+                            f.close()
+                            segment += 1
+                            path = self._segment_path(segment)
+                            f = open(path, "ab")
+                            offset = 0
+                        f.write(record)
+                        entries.append((text_id, segment, offset, len(record)))
+                        offset += len(record)
+                    f.flush()
+                    if ARCHIVE_FSYNC:
+                        os.fsync(f.fileno())
+                finally:
+                    f.close()
+                # Records are written before their entries, so the index never points past them
+                self._write_index(entries)
+                self._refresh()
+            finally:
+                lock_file.close()
+
+    def append(self, text_doc: Dict[str, Any]) -> None:
+        """Append a text document to the archive."""
+        self.append_many([text_doc])
+
+    def get(self, text_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get the latest saved version of a text.
+
+        Args:
+            text_id: ID of the text
+
+        Returns:
+            The text document, or None if it is not archived
+        """
+        text_id = int(text_id)
+        with self._lock:
+            for attempt in range(2):
+                entry = self._entries.get(text_id)
+                if entry is None or attempt:
+                    # Another process may have appended or compacted since
+                    self._refresh()
+                    entry = self._entries.get(text_id)
+                if entry is None:
+                    return None
+                segment, offset, length = entry
+                try:
+                    with open(self._segment_path(segment), "rb") as f:
+                        f.seek(offset)
+                        return decode_record(f.read(length))
+                except FileNotFoundError:
+                    # Removed by a compaction in another process
+                    continue
+            return None
+
+    def __contains__(self, text_id: int) -> bool:
+        with self._lock:
+            self._refresh()
+            return int(text_id) in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._entries)
+
+    def ids(self) -> List[int]:
+        """Return the IDs of the archived texts, in order."""
+        with self._lock:
+            self._refresh()
+            return sorted(self._entries)
+
+    def iter_texts(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over the latest version of every archived text, in ID order."""
+        for text_id in self.ids():
+            text_doc = self.get(text_id)
+            if text_doc is not None:
+                yield text_doc
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of texts and segments, and the live and total sizes on disk."""
+        with self._lock:
+            self._refresh()
+            segments = self._segments()
+            total_bytes = sum(os.path.getsize(self._segment_path(segment)) for segment in segments)
+            live_bytes = sum(length for _, _, length in self._entries.values())
+            return {
+                "texts": len(self._entries),
+                "segments": len(segments),
+                "total_bytes": total_bytes,
+                "live_bytes": live_bytes,
+                "dead_ratio": 1 - live_bytes / total_bytes if total_bytes else 0.0
+            }
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        Rewrite the latest record of every text into new segments, in ID order.
+
+        Superseded records and unindexed leftovers are dropped. The new
+        index replaces the old one atomically, and the old segments are
+        removed afterwards.
+
+        Returns:
+            The archive stats after compaction
+        """
+        with self._lock:
+            lock_file = self._lock_file()
+            try:
+                self._refresh()
+                old_segments = self._segments()
+                for segment in old_segments[-1:]:
+                    self._recover(segment)
+                segment = (old_segments[-1] if old_segments else 0) + 1
+
+                entries = []
+                out = open(self._segment_path(segment), "wb")
+                try:
+                    offset = 0
+                    for text_id in sorted(self._entries):
+                        old_segment, old_offset, length = self._entries[text_id]
+                        with open(self._segment_path(old_segment), "rb") as f:
+                            f.seek(old_offset)
+                            record = f.read(length)
+                        if offset >= self.segment_size:
+                            out.close()
+                            segment += 1
+                            out = open(self._segment_path(segment), "wb")
+                            offset = 0
+                        out.write(record)
+                        entries.append((text_id, segment, offset, length))
+                        offset += length
+                    out.flush()
+                    os.fsync(out.fileno())
+                finally:
+                    out.close()
+
+                tmp_path = self.index_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.index_path)
+                for old_segment in old_segments:
+                    os.remove(self._segment_path(old_segment))
+                self._refresh()
+            finally:
+                lock_file.close()
+        return self.stats()
+
+    def rebuild_index(self) -> int:
+        """
+        Rebuild the index by scanning every segment, e.g. after losing it.
+
+        Returns:
+            The number of archived texts
+        """
+        with self._lock:
+            lock_file = self._lock_file()
+            try:
+                entries = {}
+                for segment in self._segments():
+                    for offset, length, text_doc in iter_segment_records(self._segment_path(segment)):
+                        entries[int(text_doc["_id"])] = (segment, offset, length)
+                tmp_path = self.index_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(b"".join(INDEX_ENTRY.pack(text_id, *entry) for text_id, entry in entries.items()))
+                os.replace(tmp_path, self.index_path)
+                self._refresh()
+                return len(self._entries)
+            finally:
+                lock_file.close()
+
+    def export_json(self, text_id: int, output_path: Optional[str] = None) -> str:
+        """
+        Write an archived text to its own JSON file in Saved_qcms, as saves used to.
+
+        Args:
+            text_id: ID of the text
+            output_path: Optional path of the JSON file (defaults to text_<id>.json)
+
+        Returns:
+            The path to the JSON file
+        """
+        from db import write_text_json
+
+        text_doc = self.get(text_id)
+        if text_doc is None:
+            raise ValueError(f"Text with ID {text_id} is not archived")
+        return write_text_json(text_doc, output_path)
+
+    def migrate(self, directory: str) -> int:
+        """
+        Append the per-text JSON files of a directory (text_<id>.json) to the archive.
+
+        Files that are not stored text documents are skipped. The files
+        are left in place.
+
+        Returns:
+            The number of texts archived
+        """
+        text_docs = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    text_doc = json.load(f)
+                if not isinstance(text_doc, dict) or "content" not in text_doc:
+                    raise ValueError("not a stored text document")
+                int(text_doc["_id"])
+            except (OSError, KeyError, TypeError, ValueError) as e:
+                print(f"Skipping {path}: {e}")
+                continue
+            text_docs.append(text_doc)
+        self.append_many(text_docs)
+        return len(text_docs)
+
+
+_default_archive = None
+_default_archive_lock = threading.Lock()
+
+
+def get_archive() -> QCMArchive:
+    """Return the process-wide archive, creating it on first use."""
+    global _default_archive
+    with _default_archive_lock:
+        if _default_archive is None:
+            _default_archive = QCMArchive()
+        return _default_archive
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Manage the archive of saved QCM sets')
+    parser.add_argument('--archive', default=ARCHIVE_DIR, help='Archive directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='Show the size of the archive')
+    commands.add_parser('compact', help='Drop superseded records and rewrite the segments')
+    commands.add_parser('rebuild-index', help='Rebuild the offset index from the segments')
+    export_parser = commands.add_parser('export', help='Write archived texts to per-text JSON files')
+    export_parser.add_argument('ids', nargs='*', type=int, help='IDs of the texts (all if omitted)')
+    migrate_parser = commands.add_parser('migrate', help='Archive existing text_<id>.json files')
+    migrate_parser.add_argument('directory', nargs='?', default='Saved_qcms', help='Directory of the JSON files')
+
+    args = parser.parse_args()
+
+    archive = QCMArchive(args.archive)
+    if args.command == 'stats':
+        print(json.dumps(archive.stats(), indent=2))
+    elif args.command == 'compact':
+        before = archive.stats()
+        after = archive.compact()
+        print(f"Compacted {before['total_bytes']} bytes in {before['segments']} segments "
+              f"to {after['total_bytes']} bytes in {after['segments']} segments")
+    elif args.command == 'rebuild-index':
+        print(f"Indexed {archive.rebuild_index()} texts")
+    elif args.command == 'export':
+        for text_id in args.ids or archive.ids():
+            print(archive.export_json(text_id))
+    elif args.command == 'migrate':
+        print(f"Archived {archive.migrate(args.directory)} texts")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Two-tier cache for LLM generation and improvement results.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+DEFAULT_RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "cache/results.sqlite")
+DEFAULT_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+DEFAULT_TTL = float(os.getenv("RESULT_CACHE_TTL", "86400"))
+
+
+def make_key(kind: str, context: str, **params) -> str:
+    """
+    Build a cache key from the kind of result, its context and its parameters.
+
+    Args:
+        kind: Kind of result (e.g. "generation" or "improvement")
+        context: Text the result was produced from
+        **params: Other inputs of the result (model, prompt version, ...)
+
+    Returns:
+        The SHA-256 hex digest identifying the result
+    """
+    payload = json.dumps(
+        {"kind": kind, "context": hashlib.sha256(context.encode("utf-8")).hexdigest(), **params},
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path: Optional[str] = DEFAULT_RESULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: float = DEFAULT_TTL):
+        """
+        Initialize the result cache.
+
+        Results live in an in-memory LRU of max_entries items backed by a
+        SQLite table, and expire ttl seconds after they were stored.
+
+        Args:
+            path: Path to the SQLite database file (None for memory only)
+            max_entries: Maximum number of results kept in memory
+            ttl: Seconds a result stays valid
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self._conn = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached result for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+            if self._conn is not None:
+                row = self._conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    if now - row[1] <= self.ttl:
+                        value = json.loads(row[0])
+                        self._remember(key, value, row[1])
+                        self._stats["disk_hits"] += 1
+                        return value
+                    self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._conn.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable result under key."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now)
+                )
+                # Drop expired rows so the disk tier does not grow forever
+                self._conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+                self._conn.commit()
+
+    def _remember(self, key: str, value: Any, created: float) -> None:
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit and miss counters with the overall hit rate."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Return the process-wide result cache, or None when RESULT_CACHE_ENABLED is off."""
+    global _default_cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
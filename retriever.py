@@ -4,6 +4,7 @@ Retriever module for finding relevant Arabic text chunks.
 import numpy as np
 from typing import List, Dict, Any
 from .embedding import ArabicEmbedder
+from .vector_index import search_index
 
 class ArabicRetriever:
     def __init__(self, embedder: ArabicEmbedder, top_k: int = 3):
@@ -35,9 +36,9 @@ class ArabicRetriever:
         
         # Search the index
         k = min(self.top_k, len(self.embedder.chunks))
-        distances, indices = self.embedder.index.search(query_embedding.astype('float32'), k)
+        distances, indices = search_index(self.embedder.index, query_embedding, k)
         
-        # Get the relevant chunks
-        relevant_chunks = [self.embedder.chunks[idx] for idx in indices[0]]
+        # Get the relevant chunks (approximate indexes pad missing results with -1)
+        relevant_chunks = [self.embedder.chunks[idx] for idx in indices[0] if idx >= 0]
         
         return relevant_chunks
\ No newline at end of file
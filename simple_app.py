@@ -1,24 +1,112 @@
 """
 Simple FastAPI web application for Arabic QCM Generator.
 """
+import time
+
+# Reference point of the startup timings
+_import_started = time.perf_counter()
+
 import os
+import sys
 import json
-import time
-from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, Request, Form, UploadFile, File, BackgroundTasks
-from fastapi.responses import HTMLResponse, JSONResponse
+import asyncio
+import hashlib
+import threading
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, Literal
+from fastapi import FastAPI, Request, Form, UploadFile, File, Query
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import uvicorn
 
-# Import the QCM generator
-from arabic_diacritized_qcm_v3 import ArabicDiacritizedQCMGenerator
-from db import save_text_with_qcms, save_text_to_json, get_all_texts, get_text_by_id
+# Heavy modules (faiss, numpy, PyPDF2, openai, pymongo) are imported on first use
+import db
+import async_db
+from db import write_text_json
+from qcm_archive import get_archive
 from models import Text, QCM
+from jobs import JobQueueFull, generation_queue_from_env, ingestion_queue_from_env
+from result_cache import get_result_cache
+from paragraphs import PARAGRAPH_STREAM_THRESHOLD, get_paragraph_cache
+
+# Build the generator, indexes and database connection in the background at startup
+APP_WARMUP = os.getenv("APP_WARMUP", "true").lower() in ("1", "true", "yes")
+# Print how long each startup step takes
+STARTUP_TIMING = os.getenv("STARTUP_TIMING", "false").lower() in ("1", "true", "yes")
+# Also write each saved QCM set to its own file in Saved_qcms, besides the archive
+SAVE_JSON_FILES = os.getenv("SAVE_JSON_FILES", "false").lower() in ("1", "true", "yes")
+
+startup_timings: Dict[str, float] = {}
+
+def record_startup(step: str, started: float) -> None:
+    """Record the duration of a startup step in seconds."""
+    startup_timings[step] = round(time.perf_counter() - started, 3)
+    if STARTUP_TIMING:
+        print(f"Startup: {step} took {startup_timings[step]:.3f}s")
+
+record_startup("import", _import_started)
+
+# QCM generator and per-document indexes, created on first use
+_generator = None
+_index_registry = None
+_components_lock = threading.Lock()
+
+def get_generator():
+    """Get the QCM generator, importing and creating it on first use."""
+    global _generator
+    with _components_lock:
+        if _generator is None:
+            started = time.perf_counter()
+            from arabic_diacritized_qcm_v3 import ArabicDiacritizedQCMGenerator
+            _generator = ArabicDiacritizedQCMGenerator()
+            record_startup("generator", started)
+        return _generator
+
+def get_index_registry():
+    """Get the registry of per-document indexes, creating it on first use."""
+    global _index_registry
+    with _components_lock:
+        if _index_registry is None:
+            started = time.perf_counter()
+            from index_registry import IndexRegistry
+            _index_registry = IndexRegistry()
+            record_startup("index_registry", started)
+        return _index_registry
+
+def warm_up() -> None:
+    """Create the heavy components ahead of the first request, logging what fails."""
+    for step, fn in (("generator", get_generator), ("index_registry", get_index_registry)):
+        try:
+            fn()
+        except Exception as e:
+            print(f"Startup: could not create the {step}: {e}")
+    started = time.perf_counter()
+    # MongoDB may still be starting; requests connect again on first use
+    if db.ping():
+        record_startup("database", started)
+    record_startup("warm_up", _import_started)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start warming up without blocking startup, and stop the workers on shutdown."""
+    if APP_WARMUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    record_startup("ready", _import_started)
+    yield
+    generation_queue.shutdown()
+    ingestion_queue.shutdown()
+    if "pdf_extraction" in sys.modules:
+        sys.modules["pdf_extraction"].shutdown_extraction_pools()
+    if "llm_gateway" in sys.modules:
+        sys.modules["llm_gateway"].close_gateway()
+    async_db.shutdown()
+    db.close()
 
 # Initialize FastAPI app
-app = FastAPI(title="Arabic QCM Generator")
+app = FastAPI(title="Arabic QCM Generator", lifespan=lifespan)
 
 # Mount static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -26,11 +114,12 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Set up templates
 templates = Jinja2Templates(directory="templates")
 
-# Initialize QCM generator
-generator = ArabicDiacritizedQCMGenerator()
+# Generation and ingestion jobs run on bounded worker pools
+generation_queue = generation_queue_from_env()
+ingestion_queue = ingestion_queue_from_env()
 
-# Store background tasks
-background_tasks = {}
+# Paragraph offsets of recent texts, shared by /extract-paragraphs and generation
+paragraph_cache = get_paragraph_cache()
 
 # Define models
 class QCMRequest(BaseModel):
@@ -41,6 +130,9 @@ class QCMRequest(BaseModel):
     selected_paragraphs: Optional[List[int]] = None
     level: Optional[int] = 1
     difficulty: Optional[str] = "medium"
+    # Checked before queuing, so a typo does not discard a finished generation (see improvement.IMPROVEMENT_MODES)
+    improvement_mode: Optional[Literal["per_question", "batch"]] = None
+    force_fresh: bool = False
 
 class TextRequest(BaseModel):
     text: str
@@ -51,48 +143,83 @@ class SaveQCMRequest(BaseModel):
     level: int = 1
     difficulty: str = "medium"
 
+class SaveQCMSetsRequest(BaseModel):
+    sets: List[SaveQCMRequest]
+
 @app.get("/", response_class=HTMLResponse)
 async def get_home(request: Request):
     """Render the home page."""
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.post("/generate")
-async def generate_qcms(request: QCMRequest, background_tasks: BackgroundTasks):
+async def generate_qcms(request: QCMRequest):
     """Generate QCMs from text."""
     # Generate a unique task ID
     task_id = os.urandom(8).hex()
     
-    # Start the generation task in the background
-    background_tasks.add_task(
-        generate_qcms_task, 
-        task_id, 
-        request.text, 
-        request.num_questions, 
-        request.model,
-        request.document_path,
-        request.selected_paragraphs,
-        request.level,
-        request.difficulty
-    )
+    # Queue the generation task, refusing it when the queue is full
+    try:
+        generation_queue.submit(
+            task_id,
+            generate_qcms_task,
+            task_id, 
+            request.text, 
+            request.num_questions, 
+            request.model,
+            request.document_path,
+            request.selected_paragraphs,
+            request.level,
+            request.difficulty,
+            request.improvement_mode,
+            request.force_fresh
+        )
+    except JobQueueFull as e:
+        return JSONResponse(status_code=429, content={"status": "rejected", "error": str(e)})
     
-    return {"task_id": task_id, "status": "processing"}
+    return {"task_id": task_id, "status": "queued", "queue_depth": generation_queue.queue_depth()}
 
 @app.get("/status/{task_id}")
 async def get_task_status(task_id: str):
     """Get the status of a generation task."""
-    if task_id not in background_tasks:
+    task = generation_queue.get(task_id)
+    if task is None:
         return {"status": "not_found"}
     
-    status = background_tasks[task_id]["status"]
+    status = task["status"]
     
     if status == "completed":
-        questions = background_tasks[task_id]["questions"]
-        return {"status": status, "questions": questions}
+        return {"status": status, "questions": task["questions"]}
     elif status == "error":
-        error = background_tasks[task_id]["error"]
-        return {"status": status, "error": error}
+        return {"status": status, "error": task["error"]}
+    elif status == "queued":
+        return {"status": status, "queue_position": task.get("queue_position"), "queue_depth": task["queue_depth"]}
     else:
-        return {"status": status}
+        return {"status": status, "queue_depth": task["queue_depth"]}
+
+@app.get("/stream/{task_id}")
+async def stream_task(task_id: str):
+    """Stream the events of a generation task as server-sent events."""
+    async def event_stream():
+        cursor = 0
+        while True:
+            events, finished = generation_queue.events_since(task_id, cursor)
+            cursor += len(events)
+            for event in events:
+                if event.get("status") == "completed":
+                    task = generation_queue.get(task_id)
+                    event = dict(event, questions=task["questions"] if task else [])
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if finished and not events:
+                if cursor == 0:
+                    yield f"event: status\ndata: {json.dumps({'event': 'status', 'status': 'not_found'})}\n\n"
+                break
+            await asyncio.sleep(0.1)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/extract-paragraphs", response_class=JSONResponse)
 async def extract_paragraphs(request: TextRequest):
@@ -102,329 +229,359 @@ async def extract_paragraphs(request: TextRequest):
         if not raw_text:
             return {"success": False, "message": "No text provided"}
         
-        # Split text into paragraphs using Arabic punctuation
-        paragraphs = []
-        current_paragraph = ""
-        
-        for char in raw_text:
-            current_paragraph += char
-            # Arabic full stop (.) and comma (،) as delimiters
-            if char in [".", "،", "؟", "!"]:
-                if current_paragraph.strip():
-                    paragraphs.append(current_paragraph.strip())
-                current_paragraph = ""
+        # Split off the event loop; large texts are sent back as they are serialized
+        spans = await run_in_threadpool(paragraph_cache.spans, raw_text)
+        if len(raw_text) > PARAGRAPH_STREAM_THRESHOLD:
+            return StreamingResponse(stream_paragraphs(raw_text, spans), media_type="application/json")
         
-        # Add the last paragraph if it's not empty
-        if current_paragraph.strip():
-            paragraphs.append(current_paragraph.strip())
-        
-        return {"success": True, "paragraphs": paragraphs}
+        return {"success": True, "paragraphs": [raw_text[start:end] for start, end in spans]}
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+def stream_paragraphs(text: str, spans: List[tuple]):
+    """Yield the /extract-paragraphs JSON response in pieces of 1000 paragraphs."""
+    yield '{"success": true, "paragraphs": ['
+    for i in range(0, len(spans), 1000):
+        batch = [text[start:end] for start, end in spans[i:i + 1000]]
+        yield ("," if i else "") + json.dumps(batch, ensure_ascii=False)[1:-1]
+    yield ']}'
+
+def write_upload(file_path: str, content: bytes) -> None:
+    """Write an uploaded file, replacing any previous version atomically."""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path + ".part", "wb") as f:
+        f.write(content)
+    os.replace(file_path + ".part", file_path)
+
+def ingest_pdf_task(job_id: str, file_path: str, content_hash: str):
+    """Background task to index an uploaded PDF."""
+    # A new document is searchable while it is ingested; a re-uploaded one
+    # keeps serving its previous index until the new one is complete
+    generator = get_generator()
+    index_registry = get_index_registry()
+    replacing = index_registry.has(file_path)
+    
+    def report_progress(pages_parsed, chunks_embedded):
+        ingestion_queue.update(job_id, pages_parsed=pages_parsed, chunks_embedded=chunks_embedded)
+    
+    try:
+        document = generator.build_document_index(
+            file_path,
+            on_start=None if replacing else index_registry.publish,
+            on_progress=report_progress
+        )
+    except Exception:
+        # Stop serving the partial index of a new document
+        index_registry.discard(file_path)
+        raise
+    index_registry.register(file_path, document.index, document.chunks, content_hash, document.pages,
+                            generator.embedder.name)
+    
+    print(f"PDF file uploaded and processed: {os.path.basename(file_path)}")
+    print("PDF content indexed for RAG-based question generation")
+    ingestion_queue.update(job_id, status="completed", num_chunks=len(document.chunks))
+
 @app.post("/upload-pdf")
 async def upload_pdf(file: UploadFile = File(...)):
-    """Upload a PDF file for training."""
+    """Upload a PDF file for training and index it in the background."""
     try:
-        # Save the uploaded file
+        # Save the uploaded file off the event loop
         file_path = f"uploads/{file.filename}"
-        os.makedirs("uploads", exist_ok=True)
+        content = await file.read()
+        await run_in_threadpool(write_upload, file_path, content)
+        # The first upload may have to create the generator and registry
+        generator = await run_in_threadpool(get_generator)
+        index_registry = await run_in_threadpool(get_index_registry)
+        document_path = index_registry.document_key(file_path)
         
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Skip indexing if the same content is already indexed
+        content_hash = hashlib.sha256(content).hexdigest()
+        if index_registry.is_current(file_path, content_hash, generator.embedder.name):
+            print(f"PDF file already indexed: {file.filename}")
+            return {
+                "success": True,
+                "message": "PDF uploaded successfully. The system will use RAG to generate questions based on this document.",
+                "document_path": document_path,
+                "status": "completed"
+            }
         
-        # Load the training data
-        generator.load_training_data(file_path)
-        
-        # Print confirmation message
-        print(f"PDF file uploaded and processed: {file.filename}")
-        print("PDF content indexed for RAG-based question generation")
+        job_id = os.urandom(8).hex()
+        try:
+            ingestion_queue.submit(job_id, ingest_pdf_task, job_id, file_path, content_hash,
+                                   fields={"document_path": document_path, "pages_parsed": 0, "chunks_embedded": 0})
+        except JobQueueFull as e:
+            return JSONResponse(status_code=429, content={"success": False, "message": str(e)})
         
-        return {"success": True, "message": "PDF uploaded successfully. The system will use RAG to generate questions based on this document."}
+        return {
+            "success": True,
+            "message": "PDF uploaded successfully. It is being indexed for RAG-based question generation.",
+            "document_path": document_path,
+            "job_id": job_id,
+            "status": "queued"
+        }
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+@app.get("/ingestion/{job_id}")
+async def get_ingestion_status(job_id: str):
+    """Get the status and progress of an ingestion job."""
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        return {"status": "not_found"}
+    job.pop("timestamp", None)
+    return job
+
+@app.get("/health", response_class=JSONResponse)
+async def health():
+    """Check that the app and MongoDB are up, answering 503 when MongoDB is unreachable."""
+    database = await async_db.health()
+    status_code = 200 if database["status"] == "ok" else 503
+    return JSONResponse(status_code=status_code, content={"status": database["status"], "database": database})
+
+@app.get("/documents", response_class=JSONResponse)
+async def list_documents():
+    """List the indexed documents."""
+    index_registry = await run_in_threadpool(get_index_registry)
+    return {"success": True, "documents": index_registry.list_documents()}
+
+@app.get("/cache-stats", response_class=JSONResponse)
+async def cache_stats():
+    """Get the hit-rate statistics of the result cache and the query embedding cache."""
+    result_cache = get_result_cache()
+    # Only reported once the generator exists, creating it here would slow the call down
+    query_stats = _generator.query_cache.stats() if _generator is not None else None
+    if result_cache is None:
+        return {"success": True, "enabled": False, "query_embeddings": query_stats}
+    return {"success": True, "enabled": True, "stats": result_cache.stats(), "query_embeddings": query_stats}
+
+@app.get("/pool-stats", response_class=JSONResponse)
+async def pool_stats():
+    """Get the metrics of the OpenAI connection pool."""
+    from llm_gateway import get_gateway
+    return {"success": True, "stats": get_gateway().pool_stats()}
+
+def write_json(file_path: str, data: Any) -> None:
+    """Write data to a JSON file."""
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
 @app.post("/save-question", response_class=JSONResponse)
 async def save_question(question: dict):
     """Save a single question to JSON."""
     try:
-        # Save to JSON file
+        # Save to JSON file off the event loop
         timestamp = int(time.time())
         json_filename = f"question_{timestamp}.json"
-        
-        with open(json_filename, "w", encoding="utf-8") as f:
-            json.dump(question, f, ensure_ascii=False, indent=2)
+        await run_in_threadpool(write_json, json_filename, question)
         
         return {"success": True, "message": f"Question saved to {json_filename}"}
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+def archive_texts(text_docs: List[Dict[str, Any]]) -> List[str]:
+    """
+    Append saved text documents to the QCM archive, and to their own JSON files if SAVE_JSON_FILES is on.
+    
+    Returns:
+        The paths of the JSON files written (none unless SAVE_JSON_FILES is on)
+    """
+    get_archive().append_many(text_docs)
+    if not SAVE_JSON_FILES:
+        return []
+    return [write_text_json(text_doc, f"text_{text_doc['_id']}.json") for text_doc in text_docs]
+
+def export_url(text_id) -> str:
+    """URL downloading a saved text as a JSON file (see export_text_json)."""
+    return f"/texts/{text_id}/json"
+
 @app.post("/save-qcm-set", response_class=JSONResponse)
 async def save_qcm_set(request: SaveQCMRequest):
-    """Save a set of QCMs to MongoDB and JSON file."""
+    """Save a set of QCMs to MongoDB and the QCM archive."""
     try:
-        # Ensure Saved_qcms directory exists
-        os.makedirs("Saved_qcms", exist_ok=True)
-        
         # Save to MongoDB
-        text_id = save_text_with_qcms(
+        text_doc = await async_db.insert_text(
             request.text_content,
             request.level,
             request.difficulty,
             request.questions
         )
+        text_id = str(text_doc["_id"])
         
-        # Save to JSON file
-        json_filename = f"text_{text_id}.json"
-        full_path = save_text_to_json(text_id, json_filename)
+        # Archive the in-memory document, without reading it back
+        json_paths = await run_in_threadpool(archive_texts, [text_doc])
         
-        return {
+        response = {
             "success": True, 
-            "message": f"QCM set saved to MongoDB and {full_path}",
+            "message": "QCM set saved to MongoDB and the QCM archive",
             "text_id": text_id,
-            "file": json_filename
+            "export_url": export_url(text_id)
         }
+        if json_paths:
+            response["file"] = json_paths[0]
+        return response
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+@app.post("/save-qcm-sets", response_class=JSONResponse)
+async def save_qcm_sets(request: SaveQCMSetsRequest):
+    """Save many sets of QCMs to MongoDB in one insert, and to the QCM archive in one append."""
+    try:
+        if not request.sets:
+            return {"success": False, "message": "No QCM sets provided"}
+        
+        text_sets = [
+            {"text_content": item.text_content, "level": item.level, "difficulty": item.difficulty,
+             "questions": item.questions}
+            for item in request.sets
+        ]
+        text_docs = await async_db.insert_texts(text_sets)
+        json_paths = await run_in_threadpool(archive_texts, text_docs)
+        
+        response = {
+            "success": True,
+            "message": f"{len(text_docs)} QCM sets saved to MongoDB and the QCM archive",
+            "text_ids": [str(text_doc["_id"]) for text_doc in text_docs],
+            "export_urls": [export_url(text_doc["_id"]) for text_doc in text_docs]
+        }
+        if json_paths:
+            response["files"] = json_paths
+        return response
     except Exception as e:
         return {"success": False, "message": str(e)}
 
 @app.get("/texts", response_class=JSONResponse)
-async def list_texts():
-    """List all texts in the database."""
+async def list_texts(cursor: Optional[int] = None, limit: int = Query(50, ge=1, le=500),
+                     level: Optional[int] = Query(None, ge=1, le=6),
+                     difficulty: Optional[str] = Query(None, pattern="^(easy|medium|hard)$"),
+                     view: str = Query("summary", pattern="^(summary|full)$")):
+    """
+    List one page of texts in the database.
+    
+    Pass the returned next_cursor as cursor to get the following page. The
+    summary view leaves out the content and QCMs of the texts.
+    """
     try:
-        texts = get_all_texts()
-        return {"success": True, "texts": texts}
+        texts, next_cursor = await async_db.list_texts(cursor, limit, level, difficulty, view == "summary")
+        return {"success": True, "texts": texts, "next_cursor": next_cursor}
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+@app.get("/texts/export")
+async def export_texts(level: Optional[int] = Query(None, ge=1, le=6),
+                       difficulty: Optional[str] = Query(None, pattern="^(easy|medium|hard)$"),
+                       view: str = Query("full", pattern="^(summary|full)$")):
+    """Stream all matching texts as newline-delimited JSON, one text per line."""
+    async def lines():
+        async for text in async_db.iter_texts(level, difficulty, summary=view == "summary"):
+            yield json.dumps(text, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.get("/texts/{text_id}", response_class=JSONResponse)
 async def get_text(text_id: str):
     """Get a text by its ID."""
     try:
-        text = get_text_by_id(text_id)
+        text = await async_db.get_text_by_id(text_id)
         return {"success": True, "text": text}
     except Exception as e:
         return {"success": False, "message": str(e)}
 
+@app.get("/texts/{text_id}/json", response_class=JSONResponse)
+async def export_text_json(text_id: int):
+    """Download a saved text as a JSON file, from the QCM archive or else MongoDB."""
+    try:
+        text = await run_in_threadpool(get_archive().get, text_id)
+        if text is None:
+            text = await async_db.get_text_by_id(str(text_id))
+        return JSONResponse(
+            content=text,
+            headers={"Content-Disposition": f'attachment; filename="text_{text_id}.json"'}
+        )
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
 def generate_qcms_task(task_id: str, text: str, num_questions: int, model: str, 
                        document_path: Optional[str] = None, selected_paragraphs: Optional[List[int]] = None,
-                       level: int = 1, difficulty: str = "medium"):
+                       level: int = 1, difficulty: str = "medium", improvement_mode: Optional[str] = None,
+                       force_fresh: bool = False):
     """Background task to generate QCMs."""
-    import time
-    
-    # Store task info
-    background_tasks[task_id] = {
-        "status": "processing",
-        "timestamp": time.time()
-    }
-    
     try:
+        from improvement import improve_qcm_set
+        from llm_gateway import get_gateway
+        generator = get_generator()
+        index_registry = get_index_registry()
+        
         # Set the model (always use gpt-4o-mini as requested)
         generator.model = "gpt-4o-mini"
         
         # Process selected paragraphs
         if selected_paragraphs and isinstance(selected_paragraphs, list):
-            paragraphs = []
-            # Split text into paragraphs
-            all_paragraphs = []
-            current_paragraph = ""
-            
-            for char in text:
-                current_paragraph += char
-                if char in [".", "،", "؟", "!"]:
-                    if current_paragraph.strip():
-                        all_paragraphs.append(current_paragraph.strip())
-                    current_paragraph = ""
-            
-            if current_paragraph.strip():
-                all_paragraphs.append(current_paragraph.strip())
-            
-            # Get selected paragraphs
-            for idx in selected_paragraphs:
-                if 0 <= idx < len(all_paragraphs):
-                    paragraphs.append(all_paragraphs[idx])
-            
-            # Join selected paragraphs
-            if paragraphs:
-                text = " ".join(paragraphs)
-            else:
-                # If no paragraphs were selected, use the first paragraph
-                text = all_paragraphs[0] if all_paragraphs else text
+            text = paragraph_cache.select(text, selected_paragraphs)
+        
+        # Route to the index of the requested document, falling back to the latest upload
+        generation_queue.publish(task_id, "stage", stage="retrieval")
+        document = index_registry.get(document_path) if document_path else None
+        if document is None:
+            document = index_registry.latest()
         
         # Generate QCMs using RAG (Retrieval Augmented Generation)
         # Setting direct_text=False to use RAG with the uploaded PDF
-        qcms = generator.generate_diacritized_qcm(text, num_questions, direct_text=False)
+        generation_queue.publish(task_id, "stage", stage="generation")
+        qcms = generator.generate_diacritized_qcm(text, num_questions, direct_text=False, document=document,
+                                                  force_fresh=force_fresh)
         print(f"Generating {num_questions} QCMs using RAG with query: {text[:100]}...")
+        for index, qcm in enumerate(qcms):
+            generation_queue.publish(task_id, "question", index=index, question=qcm, improved=False)
         
-        # Improve each generated QCM
-        try:
-            from openai import OpenAI
-            api_key = os.getenv("OPENAI_API_KEY")
-            if api_key:
-                client = OpenAI(api_key=api_key)
-                
-                improved_qcms = []
-                for qcm in qcms:
-                    # Create prompt for improvement
-                    prompt = f"""
-أنا بحاجة إلى تحسين سؤال اختيار من متعدد (QCM) بناءً على النص التالي:
-
-النص:
-{text}
-
-السؤال الحالي:
-{qcm["question"]}
-
-الإجابة الصحيحة:
-{qcm["correct_answer"]}
-
-الخيارات:
-{", ".join(qcm["choices"])}
-
-يرجى تحسين السؤال والإجابات مع مراعاة ما يلي:
-1. تأكد من أن السؤال والإجابات مرتبطة بالنص المقدم فقط.
-2. تأكد من التشكيل الكامل لجميع الكلمات.
-3. تأكد من صحة اللغة والنحو.
-4. تأكد من أن الضمائر والسياق متناسقة.
-5. تأكد من أن الإجابة الصحيحة واضحة وغير ملتبسة.
-6. تأكد من أن الخيارات الخاطئة معقولة ولكن غير صحيحة بوضوح.
-
-أعطني السؤال المحسن بتنسيق JSON كما يلي:
-{
-  "question": "السؤال المحسن مع التشكيل الكامل",
-  "correct_answer": "الإجابة الصحيحة المحسنة مع التشكيل الكامل",
-  "choices": [
-    "الخيار الأول",
-    "الخيار الثاني",
-    "الخيار الثالث",
-    "الخيار الرابع"
-  ]
-}
-
-تأكد من أن الإجابة الصحيحة موجودة في قائمة الخيارات.
-"""
-                    
-                    # Call OpenAI API
-                    response = client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {"role": "system", "content": "أنت مساعد متخصص في تحسين أسئلة الاختيار من متعدد باللغة العربية مع التشكيل الكامل."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.7,
-                        max_tokens=1000,
-                        response_format={"type": "json_object"}
-                    )
-                    
-                    # Parse response
-                    import json
-                    result = response.choices[0].message.content
-                    improved_qcm = json.loads(result)
-                    
-                    # Ensure the correct answer is in the choices
-                    if improved_qcm["correct_answer"] not in improved_qcm["choices"]:
-                        improved_qcm["choices"].append(improved_qcm["correct_answer"])
-                    
-                    improved_qcms.append(improved_qcm)
-                
-                # Use improved QCMs if available
-                if improved_qcms:
-                    qcms = improved_qcms
-        except Exception as e:
-            print(f"Error improving QCMs: {e}")
+        # Improve the generated QCMs, streaming each one as soon as it is done
+        generation_queue.publish(task_id, "stage", stage="improvement")
+        
+        def publish_improved(index, qcm):
+            generation_queue.publish(task_id, "question", index=index, question=qcm, improved=True)
+        
+        qcms = improve_qcm_set(get_gateway(), text, qcms, improvement_mode, on_result=publish_improved,
+                               force_fresh=force_fresh)
         
         # Store the result
-        background_tasks[task_id] = {
-            "status": "completed",
-            "questions": qcms,
-            "text_content": text,
-            "level": level,
-            "difficulty": difficulty,
-            "timestamp": time.time()
-        }
+        generation_queue.update(
+            task_id,
+            status="completed",
+            questions=qcms,
+            text_content=text,
+            level=level,
+            difficulty=difficulty
+        )
     except Exception as e:
         # Store the error
-        background_tasks[task_id] = {
-            "status": "error",
-            "error": str(e),
-            "timestamp": time.time()
-        }
+        generation_queue.update(task_id, status="error", error=str(e))
 
 @app.post("/improve-question", response_class=JSONResponse)
 async def improve_question(request: dict):
-    """Improve a single question using GPT-4o Mini."""
+    """Improve a single question, or a list of questions, using GPT-4o Mini."""
     try:
         text = request.get("text", "")
         question = request.get("question", {})
+        questions = request.get("questions", [])
         
-        if not text or not question:
+        if not text or not (question or questions):
             return {"success": False, "message": "Missing text or question"}
         
-        # Create prompt for improvement
-        prompt = f"""
-أنا بحاجة إلى تحسين سؤال اختيار من متعدد (QCM) بناءً على النص التالي:
-
-النص:
-{text}
-
-السؤال الحالي:
-{question["question"]}
-
-الإجابة الصحيحة:
-{question["correct_answer"]}
-
-الخيارات:
-{", ".join(question["choices"])}
-
-يرجى تحسين السؤال والإجابات مع مراعاة ما يلي:
-1. تأكد من أن السؤال والإجابات مرتبطة بالنص المقدم فقط.
-2. تأكد من التشكيل الكامل لجميع الكلمات.
-3. تأكد من صحة اللغة والنحو.
-4. تأكد من أن الضمائر والسياق متناسقة.
-5. تأكد من أن الإجابة الصحيحة واضحة وغير ملتبسة.
-6. تأكد من أن الخيارات الخاطئة معقولة ولكن غير صحيحة بوضوح.
-
-أعطني السؤال المحسن بتنسيق JSON كما يلي:
-{
-  "question": "السؤال المحسن مع التشكيل الكامل",
-  "correct_answer": "الإجابة الصحيحة المحسنة مع التشكيل الكامل",
-  "choices": [
-    "الخيار الأول",
-    "الخيار الثاني",
-    "الخيار الثالث",
-    "الخيار الرابع"
-  ]
-}
-
-تأكد من أن الإجابة الصحيحة موجودة في قائمة الخيارات.
-"""
-        
-        # Call OpenAI API
-        from openai import OpenAI
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            return {"success": False, "message": "OpenAI API key not found"}
-        
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "أنت مساعد متخصص في تحسين أسئلة الاختيار من متعدد باللغة العربية مع التشكيل الكامل."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1000,
-            response_format={"type": "json_object"}
-        )
+        # Call OpenAI API through the shared gateway, off the event loop since
+        # rate limiting and retries block
+        from improvement import improve_qcm, improve_qcm_set
+        from llm_gateway import get_gateway
+        gateway = await run_in_threadpool(get_gateway)
         
-        # Parse response
-        result = response.choices[0].message.content
-        import json
-        improved_question = json.loads(result)
+        if questions:
+            improved_questions = await run_in_threadpool(improve_qcm_set, gateway, text, questions, request.get("mode"),
+                                                         force_fresh=request.get("force_fresh", False))
+            return {
+                "success": True,
+                "improved_questions": improved_questions
+            }
         
-        # Ensure the correct answer is in the choices
-        if improved_question["correct_answer"] not in improved_question["choices"]:
-            improved_question["choices"].append(improved_question["correct_answer"])
+        improved_question = await run_in_threadpool(improve_qcm, gateway, text, question,
+                                                    request.get("force_fresh", False))
         
         return {
             "success": True,
@@ -434,4 +591,10 @@ async def improve_question(request: dict):
         return {"success": False, "message": str(e)}
 
 if __name__ == "__main__":
-    uvicorn.run("simple_app:app", host="127.0.0.1", port=8000)
\ No newline at end of file
+    if "--measure-startup" in sys.argv:
+        # Report how long a cold worker takes to import and warm up, then exit
+        STARTUP_TIMING = True
+        warm_up()
+        print(json.dumps(startup_timings, indent=2))
+    else:
+        uvicorn.run("simple_app:app", host="127.0.0.1", port=8000)
\ No newline at end of file
@@ -89,7 +89,7 @@ document.addEventListener('DOMContentLoaded', function() {
             .then(response => response.json())
             .then(data => {
                 if (data.task_id) {
-                    checkTaskStatus(data.task_id);
+                    streamTask(data.task_id);
                 } else {
                     showAlert('حدث خطأ أثناء إنشاء المهمة', 'error');
                     loadingSection.style.display = 'none';
@@ -102,6 +102,47 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Follow task events as they are produced, falling back to polling
+    function streamTask(taskId) {
+        if (!window.EventSource) {
+            checkTaskStatus(taskId);
+            return;
+        }
+        
+        questionsContainer.innerHTML = '';
+        const source = new EventSource(`/stream/${taskId}`);
+        let finished = false;
+        
+        source.addEventListener('question', function(e) {
+            const data = JSON.parse(e.data);
+            renderQuestion(data.question, data.index);
+            resultsSection.style.display = 'block';
+        });
+        
+        source.addEventListener('status', function(e) {
+            const data = JSON.parse(e.data);
+            if (data.status === 'completed') {
+                finished = true;
+                source.close();
+                displayResults(data.questions);
+                loadingSection.style.display = 'none';
+                resultsSection.style.display = 'block';
+            } else if (data.status === 'error' || data.status === 'not_found') {
+                finished = true;
+                source.close();
+                showAlert('حدث خطأ: ' + (data.error || data.status), 'error');
+                loadingSection.style.display = 'none';
+            }
+        });
+        
+        source.onerror = function() {
+            source.close();
+            if (!finished) {
+                checkTaskStatus(taskId);
+            }
+        };
+    }
+    
     // Check task status
     function checkTaskStatus(taskId) {
         fetch(`/status/${taskId}`)
@@ -131,88 +172,108 @@ document.addEventListener('DOMContentLoaded', function() {
         questionsContainer.innerHTML = '';
         
         questions.forEach((question, index) => {
-            const questionCard = document.createElement('div');
-            questionCard.className = 'question-card';
-            questionCard.dataset.index = index;
+            questionsContainer.appendChild(createQuestionCard(question, index));
+        });
+    }
+    
+    // Display one question, replacing the card already shown at its index
+    function renderQuestion(question, index) {
+        const card = createQuestionCard(question, index);
+        const existing = questionsContainer.querySelector(`.question-card[data-index="${index}"]`);
+        if (existing) {
+            existing.replaceWith(card);
+            return;
+        }
+        
+        // Keep cards ordered by index
+        const next = Array.from(questionsContainer.children).find(c => parseInt(c.dataset.index) > index);
+        questionsContainer.insertBefore(card, next || null);
+    }
+    
+    // Build the card of a question
+    function createQuestionCard(question, index) {
+        const questionCard = document.createElement('div');
+        questionCard.className = 'question-card';
+        questionCard.dataset.index = index;
+        
+        // Create editable question text
+        const questionText = document.createElement('div');
+        questionText.className = 'question-text';
+        questionText.contentEditable = true;
+        questionText.textContent = `${index + 1}. ${question.question}`;
+        questionText.dataset.originalText = question.question;
+        
+        const choicesList = document.createElement('ul');
+        choicesList.className = 'choices';
+        
+        question.choices.forEach((choice, choiceIndex) => {
+            const choiceItem = document.createElement('li');
+            choiceItem.className = 'choice';
+            if (choice === question.correct_answer) {
+                choiceItem.classList.add('correct');
+            }
             
-            // Create editable question text
-            const questionText = document.createElement('div');
-            questionText.className = 'question-text';
-            questionText.contentEditable = true;
-            questionText.textContent = `${index + 1}. ${question.question}`;
-            questionText.dataset.originalText = question.question;
+            // Create editable choice text
+            const choiceText = document.createElement('span');
+            choiceText.contentEditable = true;
+            choiceText.textContent = choice;
+            choiceText.dataset.originalText = choice;
             
-            const choicesList = document.createElement('ul');
-            choicesList.className = 'choices';
+            const choiceLabel = document.createElement('span');
+            choiceLabel.className = 'choice-label';
+            choiceLabel.textContent = `${String.fromCharCode(65 + choiceIndex)}. `;
             
-            question.choices.forEach((choice, choiceIndex) => {
-                const choiceItem = document.createElement('li');
-                choiceItem.className = 'choice';
-                if (choice === question.correct_answer) {
-                    choiceItem.classList.add('correct');
-                }
-                
-                // Create editable choice text
-                const choiceText = document.createElement('span');
-                choiceText.contentEditable = true;
-                choiceText.textContent = choice;
-                choiceText.dataset.originalText = choice;
-                
-                const choiceLabel = document.createElement('span');
-                choiceLabel.className = 'choice-label';
-                choiceLabel.textContent = `${String.fromCharCode(65 + choiceIndex)}. `;
-                
-                // Add radio button for selecting correct answer
-                const radioBtn = document.createElement('input');
-                radioBtn.type = 'radio';
-                radioBtn.name = `correct-answer-${index}`;
-                radioBtn.className = 'correct-answer-radio';
-                radioBtn.checked = choice === question.correct_answer;
-                radioBtn.addEventListener('change', function() {
-                    // Remove correct class from all choices in this question
-                    choicesList.querySelectorAll('.choice').forEach(c => c.classList.remove('correct'));
-                    // Add correct class to this choice
-                    choiceItem.classList.add('correct');
-                });
-                
-                choiceItem.appendChild(radioBtn);
-                choiceItem.appendChild(choiceLabel);
-                choiceItem.appendChild(choiceText);
-                
-                choicesList.appendChild(choiceItem);
+            // Add radio button for selecting correct answer
+            const radioBtn = document.createElement('input');
+            radioBtn.type = 'radio';
+            radioBtn.name = `correct-answer-${index}`;
+            radioBtn.className = 'correct-answer-radio';
+            radioBtn.checked = choice === question.correct_answer;
+            radioBtn.addEventListener('change', function() {
+                // Remove correct class from all choices in this question
+                choicesList.querySelectorAll('.choice').forEach(c => c.classList.remove('correct'));
+                // Add correct class to this choice
+                choiceItem.classList.add('correct');
             });
             
-            // Add action buttons (save, delete, and improve)
-            const actionButtons = document.createElement('div');
-            actionButtons.className = 'question-actions';
-            
-            const saveButton = document.createElement('button');
-            saveButton.className = 'action-btn save-btn';
-            saveButton.innerHTML = '<i class="fas fa-save"></i>';
-            saveButton.title = 'حفظ السؤال';
-            saveButton.onclick = function() { saveQuestion(index); };
-            
-            const deleteButton = document.createElement('button');
-            deleteButton.className = 'action-btn delete-btn';
-            deleteButton.innerHTML = '<i class="fas fa-trash"></i>';
-            deleteButton.title = 'حذف السؤال';
-            deleteButton.onclick = function() { deleteQuestion(index); };
-            
-            const improveButton = document.createElement('button');
-            improveButton.className = 'action-btn improve-btn';
-            improveButton.innerHTML = '<i class="fas fa-magic"></i>';
-            improveButton.title = 'تحسين السؤال';
-            improveButton.onclick = function() { improveQuestion(index); };
+            choiceItem.appendChild(radioBtn);
+            choiceItem.appendChild(choiceLabel);
+            choiceItem.appendChild(choiceText);
             
-            actionButtons.appendChild(saveButton);
-            actionButtons.appendChild(deleteButton);
-            actionButtons.appendChild(improveButton);
-            
-            questionCard.appendChild(questionText);
-            questionCard.appendChild(choicesList);
-            questionCard.appendChild(actionButtons);
-            questionsContainer.appendChild(questionCard);
+            choicesList.appendChild(choiceItem);
         });
+        
+        // Add action buttons (save, delete, and improve)
+        const actionButtons = document.createElement('div');
+        actionButtons.className = 'question-actions';
+        
+        const saveButton = document.createElement('button');
+        saveButton.className = 'action-btn save-btn';
+        saveButton.innerHTML = '<i class="fas fa-save"></i>';
+        saveButton.title = 'حفظ السؤال';
+        saveButton.onclick = function() { saveQuestion(index); };
+        
+        const deleteButton = document.createElement('button');
+        deleteButton.className = 'action-btn delete-btn';
+        deleteButton.innerHTML = '<i class="fas fa-trash"></i>';
+        deleteButton.title = 'حذف السؤال';
+        deleteButton.onclick = function() { deleteQuestion(index); };
+        
+        const improveButton = document.createElement('button');
+        improveButton.className = 'action-btn improve-btn';
+        improveButton.innerHTML = '<i class="fas fa-magic"></i>';
+        improveButton.title = 'تحسين السؤال';
+        improveButton.onclick = function() { improveQuestion(index); };
+        
+        actionButtons.appendChild(saveButton);
+        actionButtons.appendChild(deleteButton);
+        actionButtons.appendChild(improveButton);
+        
+        questionCard.appendChild(questionText);
+        questionCard.appendChild(choicesList);
+        questionCard.appendChild(actionButtons);
+        
+        return questionCard;
     }
     
     // Save a single question
@@ -305,7 +366,7 @@ document.addEventListener('DOMContentLoaded', function() {
             const level = levelSelect ? parseInt(levelSelect.value) : 1;
             const difficulty = difficultySelect ? difficultySelect.value : 'medium';
             
-            // Save to JSON file and MongoDB
+            // Save to MongoDB and the QCM archive
             fetch('/save-qcm-set', {
                 method: 'POST',
                 headers: {
@@ -332,14 +393,12 @@ document.addEventListener('DOMContentLoaded', function() {
                     }, null, 2));
                     const downloadAnchorNode = document.createElement('a');
                     downloadAnchorNode.setAttribute("href", dataStr);
-                    downloadAnchorNode.setAttribute("download", data.file || "qcms.json");
+                    downloadAnchorNode.setAttribute("download", data.text_id ? `text_${data.text_id}.json` : "qcms.json");
                     document.body.appendChild(downloadAnchorNode);
                     downloadAnchorNode.click();
                     downloadAnchorNode.remove();
                     
-                    window.showAlert('تم حفظ الملف في مجلد Saved_qcms', 'success');
-                    
-                    window.showAlert('تم حفظ الملف في مجلد Saved_qcms', 'success');
+                    window.showAlert('تم حفظ مجموعة الأسئلة في الأرشيف، ويمكن تنزيلها لاحقا من ' + data.export_url, 'success');
                 } else {
                     showAlert('حدث خطأ أثناء حفظ مجموعة الأسئلة: ' + data.message, 'error');
                 }
@@ -413,8 +472,13 @@ document.addEventListener('DOMContentLoaded', function() {
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
-                    showAlert('تم تحميل ملف التدريب بنجاح', 'success');
-                    if (trainingStatus) trainingStatus.style.display = 'none';
+                    if (data.document_path) selectedDocumentPath = data.document_path;
+                    if (data.job_id) {
+                        checkIngestionStatus(data.job_id);
+                    } else {
+                        showAlert('تم تحميل ملف التدريب بنجاح', 'success');
+                        if (trainingStatus) trainingStatus.style.display = 'none';
+                    }
                     
                     // Clear file input
                     if (fileUpload) fileUpload.value = '';
@@ -433,6 +497,30 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Follow the indexing of an uploaded document
+    function checkIngestionStatus(jobId) {
+        fetch(`/ingestion/${jobId}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'completed') {
+                    showAlert('تم تحميل ملف التدريب بنجاح', 'success');
+                    if (trainingStatus) trainingStatus.style.display = 'none';
+                } else if (data.status === 'error' || data.status === 'not_found') {
+                    showAlert('حدث خطأ أثناء فهرسة ملف التدريب: ' + (data.error || data.status), 'error');
+                    if (trainingStatus) trainingStatus.style.display = 'none';
+                } else {
+                    if (trainingStatus) {
+                        trainingStatus.textContent = `جاري فهرسة ملف التدريب... (${data.pages_parsed || 0} صفحة، ${data.chunks_embedded || 0} مقطع)`;
+                    }
+                    setTimeout(() => checkIngestionStatus(jobId), 2000);
+                }
+            })
+            .catch(error => {
+                showAlert('حدث خطأ أثناء التحقق من حالة الفهرسة: ' + error, 'error');
+                if (trainingStatus) trainingStatus.style.display = 'none';
+            });
+    }
+    
     // Handle raw text input for paragraph extraction
     if (rawText) {
         rawText.addEventListener('input', function() {
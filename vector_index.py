@@ -0,0 +1,181 @@
+"""
+Construction and search of FAISS indexes sized to the corpus.
+"""
+import os
+import math
+import numpy as np
+import faiss
+
+# "auto" picks the index type from the number of vectors
+FAISS_INDEX_TYPES = ("auto", "flat", "ivf", "hnsw")
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+
+# "l2" or "cosine" (inner product on normalized vectors)
+FAISS_METRICS = ("l2", "cosine")
+FAISS_METRIC = os.getenv("FAISS_METRIC", "l2")
+
+# With "auto": flat below HNSW_MIN_VECTORS, HNSW up to IVF_MIN_VECTORS, IVF-Flat above
+HNSW_MIN_VECTORS = int(os.getenv("FAISS_HNSW_MIN_VECTORS", "10000"))
+IVF_MIN_VECTORS = int(os.getenv("FAISS_IVF_MIN_VECTORS", "500000"))
+
+# Search/build parameters of the approximate indexes
+IVF_NPROBE = int(os.getenv("FAISS_NPROBE", "32"))
+HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "128"))
+
+
+def choose_index_type(num_vectors: int, index_type: str = None) -> str:
+    """
+    Pick the index type for a corpus.
+
+    Args:
+        num_vectors: Number of vectors to index
+        index_type: Requested type (defaults to FAISS_INDEX_TYPE)
+
+    Returns:
+        "flat", "ivf" or "hnsw"
+    """
+    index_type = index_type or FAISS_INDEX_TYPE
+    if index_type not in FAISS_INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
+    if index_type != "auto":
+        return index_type
+    if num_vectors < HNSW_MIN_VECTORS:
+        return "flat"
+    if num_vectors < IVF_MIN_VECTORS:
+        return "hnsw"
+    return "ivf"
+
+
+def _faiss_metric(metric: str) -> int:
+    if metric not in FAISS_METRICS:
+        raise ValueError(f"Unknown FAISS metric: {metric}")
+    return faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+
+
+def uses_cosine(index) -> bool:
+    """Check whether an index compares normalized vectors by inner product."""
+    return index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def prepare_vectors(vectors: np.ndarray, index) -> np.ndarray:
+    """Convert vectors to the float32 layout expected by an index, normalizing them for cosine indexes."""
+    vectors = np.array(vectors, dtype='float32', ndmin=2)
+    if uses_cosine(index):
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def create_flat_index(dimension: int, metric: str = None):
+    """Create an empty exact index, to which vectors can be added at any time."""
+    if _faiss_metric(metric or FAISS_METRIC) == faiss.METRIC_INNER_PRODUCT:
+        return faiss.IndexFlatIP(dimension)
+    return faiss.IndexFlatL2(dimension)
+
+
+def configure_search(index, nprobe: int = None, ef_search: int = None):
+    """
+    Set the search parameters of an approximate index.
+
+    Args:
+        index: FAISS index (left unchanged if it is flat)
+        nprobe: Number of IVF lists visited per query (defaults to FAISS_NPROBE)
+        ef_search: Size of the HNSW candidate list (defaults to FAISS_EF_SEARCH)
+
+    Returns:
+        The same index
+    """
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe or IVF_NPROBE
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+    return index
+
+
+def build_index(embeddings: np.ndarray, index_type: str = None, metric: str = None,
+                nprobe: int = None, ef_search: int = None):
+    """
+    Build a FAISS index over embeddings.
+
+    Small corpora get an exact flat index. Larger ones get HNSW, which
+    needs no training, and the largest IVF-Flat, whose lists are trained
+    on the embeddings themselves.
+
+    Args:
+        embeddings: Array of shape (n, dimension)
+        index_type: "auto", "flat", "ivf" or "hnsw" (defaults to FAISS_INDEX_TYPE)
+        metric: "l2" or "cosine" (defaults to FAISS_METRIC)
+        nprobe: IVF lists visited per query
+        ef_search: HNSW candidate list size
+
+    Returns:
+        The populated index
+    """
+    embeddings = np.array(embeddings, dtype='float32', ndmin=2)
+    num_vectors, dimension = embeddings.shape
+    faiss_metric = _faiss_metric(metric or FAISS_METRIC)
+    if faiss_metric == faiss.METRIC_INNER_PRODUCT:
+        faiss.normalize_L2(embeddings)
+
+    index_type = choose_index_type(num_vectors, index_type)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss_metric)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == "ivf":
+        # About 4 * sqrt(n) lists, each trained with at least 39 points
+        nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+        quantizer = create_flat_index(dimension, metric)
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss_metric)
+        index.train(embeddings)
+    else:
+        index = create_flat_index(dimension, metric)
+
+    index.add(embeddings)
+    configure_search(index, nprobe, ef_search)
+    print(f"Built {index_type} index ({metric or FAISS_METRIC}) with {num_vectors} vectors")
+    return index
+
+
+def optimize_index(index, index_type: str = None):
+    """
+    Rebuild an exact index as the type suited to its size.
+
+    Used after incremental ingestion, which fills a flat index so chunks
+    are searchable right away.
+
+    Args:
+        index: Flat FAISS index
+        index_type: Requested type (defaults to FAISS_INDEX_TYPE)
+
+    Returns:
+        The rebuilt index, or the same one if flat remains the best fit
+    """
+    if not isinstance(index, faiss.IndexFlat) or index.ntotal == 0:
+        return index
+    if choose_index_type(index.ntotal, index_type) == "flat":
+        return index
+    metric = "cosine" if uses_cosine(index) else "l2"
+    return build_index(index.reconstruct_n(0, index.ntotal), index_type, metric)
+
+
+def search_index(index, queries: np.ndarray, top_k: int):
+    """
+    Search an index with any metric.
+
+    Queries are normalized for cosine indexes, and their similarities are
+    reported as squared L2 distances between normalized vectors, so lower
+    always means closer. Missing results have the index -1.
+
+    Args:
+        index: FAISS index
+        queries: Array of shape (n, dimension)
+        top_k: Number of neighbours per query
+
+    Returns:
+        (distances, indices) arrays of shape (n, top_k)
+    """
+    distances, indices = index.search(prepare_vectors(queries, index), top_k)
+    if uses_cosine(index):
+        distances = 2.0 - 2.0 * distances
+    return distances, indices